@@ -1,12 +1,28 @@
 from discord.ext import commands, pages
-from discord import Embed, Colour, File
+from discord import Embed, Colour, File, Guild, HTTPException
+from tempfile import TemporaryFile
+from typing import IO, Optional
+import asyncio
+import zipfile
+import logging
+import shutil
+import os
+import time
 
 from .errors import *
-from common import get_team_name, get_integers
-from result import load_file, export_file, EmptyResult, NotAcceptableContent
+from common import get_team_name, get_team_names, get_integers, graph_renderer, graph_cache, player_resolver, shard_events, member_index, ensure_chunked, metrics
+from result import load_file, export_file, EmptyResult, NotAcceptableContent, InvalidRows
 
 
 
+UPLOAD_LIMIT: int = 8 * 1024 * 1024 - 64 * 1024
+
+
+def write_archive(z: zipfile.ZipFile, name: str, buffer: IO[bytes]) -> None:
+    with buffer, z.open(name, 'w') as f:
+        shutil.copyfileobj(buffer, f)
+
+
 class Admin(commands.Cog, name='Admin'):
 
     def __init__(self, bot: commands.Bot):
@@ -44,6 +60,7 @@ class Admin(commands.Cog, name='Admin'):
         if g is None:
             raise NotFound
 
+        await ensure_chunked(g)
         header = f'メンバー ({len(g.members)})\n'
         p = commands.Paginator(prefix='', suffix='', max_size = 3900)
 
@@ -117,6 +134,80 @@ class Admin(commands.Cog, name='Admin'):
             await ctx.author.send(f'{name}は戦績を登録していません。', delete_after=10.0)
 
 
+    @commands.is_owner()
+    @commands.command(name='mexportall', aliases=['mbackup'])
+    async def mexport_all(self, ctx: commands.Context, workers: int = 8) -> None:
+        guilds = self.bot.guilds
+        names = await asyncio.to_thread(get_team_names)
+        semaphore = asyncio.Semaphore(max(1, workers))
+        progress = await ctx.author.send(f'戦績を出力中... 0/{len(guilds)}')
+        exported, done, last = 0, 0, time.monotonic()
+
+        failed: list[tuple[Guild, Exception]] = []
+
+        async def export(guild: Guild) -> tuple[Guild, Optional[IO[bytes]]]:
+            async with semaphore:
+                try:
+                    return guild, await asyncio.to_thread(export_file, guild.id, names.get(guild.id) or guild.name)
+                except EmptyResult:
+                    return guild, None
+                except Exception as e:
+                    logging.exception(f'Failed to export results: {guild.id}')
+                    failed.append((guild, e))
+                    return guild, None
+
+        parts: list[IO[bytes]] = []
+        z: Optional[zipfile.ZipFile] = None
+
+        try:
+            for task in asyncio.as_completed([export(guild) for guild in guilds]):
+                guild, buffer = await task
+                done += 1
+
+                if buffer is not None:
+                    size = buffer.seek(0, os.SEEK_END)
+                    buffer.seek(0)
+
+                    # start a new part before this one could outgrow the upload limit
+                    if z is None or (z.namelist() and parts[-1].tell() + size > UPLOAD_LIMIT):
+                        if z is not None:
+                            z.close()
+                        parts.append(TemporaryFile())
+                        z = zipfile.ZipFile(parts[-1], 'w', compression=zipfile.ZIP_DEFLATED)
+
+                    await asyncio.to_thread(write_archive, z, f'{guild.id}.csv', buffer)
+                    exported += 1
+
+                if time.monotonic() - last >= 2.0:
+                    last = time.monotonic()
+                    await progress.edit(content=f'戦績を出力中... {done}/{len(guilds)}')
+
+            if z is not None:
+                z.close()
+
+            await progress.edit(content=f'{exported}/{len(guilds)}サーバーの戦績を出力しました。')
+
+            if failed:
+                lines = '\n'.join(f'{guild.name} ({guild.id}): {type(e).__name__}' for guild, e in failed)
+                await ctx.author.send(f'{len(failed)}サーバーの出力に失敗しました。\n```{lines[:1900]}```')
+
+            for i, archive in enumerate(parts, 1):
+                filename = 'results.zip' if len(parts) == 1 else f'results-{i}.zip'
+                archive.seek(0)
+
+                try:
+                    await ctx.author.send(file=File(archive, filename=filename))
+                except HTTPException as e:
+                    logging.exception(f'Failed to send {filename}')
+                    await ctx.author.send(f'{filename}を送信できませんでした。({archive.seek(0, os.SEEK_END)/1024/1024:.1f}MiB, {e.status})')
+        finally:
+            if z is not None:
+                z.close()
+
+            for archive in parts:
+                archive.close()
+
+
     @commands.is_owner()
     @commands.command(name='mload')
     async def mload(self, ctx: commands.Context) -> None:
@@ -135,11 +226,90 @@ class Admin(commands.Cog, name='Admin'):
         try:
             await load_file(guild.id, ctx.message.attachments[0])
             await ctx.author.send(f'{guild.name}の戦績を変更しました。')
+        except InvalidRows as e:
+            await ctx.author.send(f'不正な内容が含まれています。\n```{e}```')
+            return
         except NotAcceptableContent:
             await ctx.author.send('不正な内容が含まれています。', delete_after=10.0)
             return
 
 
+    @commands.is_owner()
+    @commands.command(name='shards')
+    async def shards(self, ctx: commands.Context) -> None:
+        latencies = dict(getattr(self.bot, 'latencies', [(0, self.bot.latency)]))
+        guilds: dict[int, int] = {}
+
+        for guild in self.bot.guilds:
+            guilds[guild.shard_id] = guilds.get(guild.shard_id, 0) + 1
+
+        lines = [f'shards: {self.bot.shard_count or 1}']
+
+        for shard_id in sorted(set(latencies) | set(guilds)):
+            latency = latencies.get(shard_id)
+            lines.append(
+                f'#{shard_id}: '
+                + (f'{latency*1000:.0f}ms, ' if latency is not None else '-, ')
+                + f'{guilds.get(shard_id, 0)} guilds, '
+                + f'{shard_events.rate(shard_id):.1f} events/s ({shard_events.totals.get(shard_id, 0)} total)'
+            )
+
+        await ctx.author.send('\n'.join(lines))
+
+
+    @commands.is_owner()
+    @commands.command(name='memory', aliases=['mem'])
+    async def memory(self, ctx: commands.Context, limit: int = 20) -> None:
+        index = member_index.memory()
+        guilds = sorted(self.bot.guilds, key=lambda g: len(g.members), reverse=True)
+        lines = [f'members cached: {sum(len(g.members) for g in guilds)}, index: {sum(index.values())/1024:.1f}KiB']
+
+        for g in guilds[:limit]:
+            lines.append(
+                f'{g.name} (`{g.id}`): {len(g.members)}/{g.member_count} members'
+                + ('' if g.chunked else ' (not chunked)')
+                + (f', index {index[g.id]/1024:.1f}KiB' if g.id in index else '')
+            )
+
+        p = commands.Paginator(prefix='', suffix='', max_size = 1900)
+
+        for line in lines:
+            p.add_line(line)
+
+        for page in p.pages:
+            await ctx.author.send(page)
+
+
+    @commands.is_owner()
+    @commands.command(name='metrics')
+    async def show_metrics(self, ctx: commands.Context, limit: int = 20) -> None:
+        stats = sorted(metrics.stats().items(), key=lambda x: x[1]['total_s'], reverse=True)
+        p = commands.Paginator(prefix='```', suffix='```', max_size = 1900)
+
+        for name, s in stats[:limit]:
+            p.add_line(
+                f'{name}: {s["count"]} calls, {s["errors"]} errors, {s["total_s"]:.1f}s total, '
+                f'p50 {s["p50_ms"]:.0f}ms / p95 {s["p95_ms"]:.0f}ms / p99 {s["p99_ms"]:.0f}ms'
+            )
+
+        errors = sorted(metrics.errors.items(), key=lambda x: x[1], reverse=True)
+
+        for (name, error), count in errors[:limit]:
+            p.add_line(f'{name} {error}: {count}')
+
+        if not stats and not errors:
+            p.add_line('No data')
+
+        p.add_line(
+            f'graph cache: {graph_cache.hits} hits, {graph_cache.misses} misses, {graph_cache.size/1024:.1f}KiB, '
+            f'{graph_renderer.pending}/{graph_renderer.max_queue} renders pending'
+        )
+        p.add_line(f'player cache: {player_resolver.hits} hits, {player_resolver.misses} misses, {len(player_resolver)} players')
+
+        for page in p.pages:
+            await ctx.author.send(page)
+
+
     @commands.Cog.listener('on_command_error')
     async def error_handler(self, ctx: commands.Context, error: commands.CommandError) -> None:
 
@@ -4,6 +4,7 @@ import discord
 
 import logging
 import json
+import time
 import os
 
 from errors import MyError
@@ -14,30 +15,117 @@ from result.cog import Result
 from handsup.cog import HandsUp
 from admin.cog import Admin
 from team.components import VoteView
+from common.plotting import graph_cache
+from common.scheduler import scheduler
+from common.shards import shard_events
+from common.metrics import metrics
+from handsup.lineup import lineup_updater
 
 config = json.loads(os.environ['CONFIG'])
 
 logging.basicConfig(level=logging.INFO)
 
+graph_cache.directory = config.get('graph_cache_dir')
+lineup_updater.repost_after = config.get('lineup_repost_after', lineup_updater.repost_after)
+lineup_updater.delay = config.get('lineup_edit_delay', lineup_updater.delay)
+
+if config.get('shard_ids'):
+    # each process keeps the jobs of its own guilds
+    scheduler.path = f"scheduler-{'-'.join(map(str, config['shard_ids']))}.json"
+
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 
-class Bot(commands.Bot):
+if config.get('member_cache') is None:
+    member_cache_flags = discord.MemberCacheFlags.from_intents(intents)
+else:
+    member_cache_flags = discord.MemberCacheFlags.none()
+    for flag in config['member_cache']:
+        setattr(member_cache_flags, flag, True)
+
+SHARDED: bool = config.get('sharding', False) or 'shard_count' in config
+BaseBot = commands.AutoShardedBot if SHARDED else commands.Bot
+
+class Bot(BaseBot):
 
     def __init__(self):
+        options = {}
+
+        if SHARDED:
+            options['shard_count'] = config.get('shard_count')
+            options['shard_ids'] = config.get('shard_ids')
+
         super().__init__(
             command_prefix = '!',
             intents = intents,
             case_insensitive = True,
-            help_command = None
+            help_command = None,
+            member_cache_flags = member_cache_flags,
+            chunk_guilds_at_startup = config.get('chunk_at_startup', True),
+            **options
         )
         self.persistent_views_added = False
+        self._time_requests()
+
+    def _time_requests(self) -> None:
+        request = self.http.request
+
+        async def timed_request(route, **kwargs):
+            with metrics.span(f'discord {route.method} {route.path}'):
+                return await request(route, **kwargs)
+
+        self.http.request = timed_request
+
+    @staticmethod
+    def observe_command(ctx, kind: str, error: Optional[Exception] = None) -> None:
+        if ctx.command is None:
+            return
+
+        name = f'{kind} {ctx.command.qualified_name}'
+        start = getattr(ctx, 'metrics_start', None)
+
+        if start is not None:
+            metrics.observe(name, time.perf_counter() - start)
+
+        if error is not None:
+            metrics.error(name, getattr(error, 'original', error))
+
+    async def on_command(self, ctx: commands.Context) -> None:
+        ctx.metrics_start = time.perf_counter()
+
+    async def on_command_completion(self, ctx: commands.Context) -> None:
+        Bot.observe_command(ctx, 'prefix')
+
+    async def on_application_command(self, ctx: discord.ApplicationContext) -> None:
+        ctx.metrics_start = time.perf_counter()
+
+    async def on_application_command_completion(self, ctx: discord.ApplicationContext) -> None:
+        Bot.observe_command(ctx, 'slash')
+
+    async def on_application_command_error(
+        self,
+        ctx: discord.ApplicationContext,
+        error: discord.DiscordException
+    ) -> None:
+        Bot.observe_command(ctx, 'slash', error)
+        await super().on_application_command_error(ctx, error)
+
+    def dispatch(self, event_name: str, *args, **kwargs) -> None:
+        shard_events.record(args)
+        super().dispatch(event_name, *args, **kwargs)
 
     async def on_ready(self):
         if not self.persistent_views_added:
             self.add_view(VoteView())
             self.persistent_views_added = True
+            scheduler.start()
+
+            if config.get('metrics_port'):
+                try:
+                    await metrics.serve(config['metrics_port'], config.get('metrics_host', '127.0.0.1'))
+                except OSError:
+                    logging.exception('Failed to serve metrics')
         logging.info('Successfully logged in')
 
 
@@ -47,6 +135,7 @@ class Bot(commands.Bot):
         error: commands.CommandError
     ) -> None:
         content: Optional[str] = None
+        Bot.observe_command(ctx, 'prefix', error)
 
         if isinstance(error, MyError):
             return
@@ -69,17 +158,17 @@ class Bot(commands.Bot):
 
         raise error
 
-bot = Bot()
-
-for cog in {
-    Lounge,
-    Mogi,
-    Utility,
-    Result,
-    HandsUp,
-    Admin
-}:
-    bot.add_cog(cog(bot))
+if __name__ == '__main__':
+    bot = Bot()
 
+    for cog in {
+        Lounge,
+        Mogi,
+        Utility,
+        Result,
+        HandsUp,
+        Admin
+    }:
+        bot.add_cog(cog(bot))
 
-bot.run(config['token'])
+    bot.run(config['token'])
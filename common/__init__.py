@@ -1,9 +1,16 @@
 from .api import *
 from .components import *
 from .lang import *
+from .member_index import *
+from .metrics import *
+from .player import *
 from .plotting import *
 from .point import *
 from .race import *
 from .rank import *
+from .rank_table import *
+from .rank_icon import *
 from .track import *
 from .utils import *
+from .scheduler import *
+from .shards import *
\ No newline at end of file
@@ -1,4 +1,4 @@
-from typing import Optional, Union
+from typing import Optional, Union, Any
 
 from google.oauth2 import service_account
 from google.cloud import storage
@@ -8,18 +8,28 @@ import gspread
 
 from datetime import datetime
 from zoneinfo import ZoneInfo
+from collections import OrderedDict
 import aiohttp
+import hashlib
 import json
 import asyncio
+import logging
 import pandas as pd
+import time
 import os
 
 from .point import Point
+from .race import Race
+from .track import Track
+from .rank_table import RANK_DATA, get_rank_table
+from .metrics import metrics
 
 # constants
 BASE_URL = 'https://www.mk8dx-lounge.com/api'
-INITIAL_DETAILS = {'recruit': {},'channel_id': None}
+INITIAL_DETAILS = {'recruit': {},'channel_id': None, 'lineup': None}
 INITIAL_RESULTS = []
+INITIAL_SUMMARY = {'total': [0, 0, 0, 0, 0], 'enemies': {}}
+INITIAL_RACES = {'key': [], 'date': [], 'track': [], 'rank': [], 'diff': [], 'stats': {}}
 
 BOT_IDS = (
     1038322985146273853, #main
@@ -46,8 +56,16 @@ sh = gc.open('Analyzer-bot')
 
 
 
-async def get(path: str, params: dict = {}) -> Optional[dict]:
-    async with aiohttp.ClientSession() as session:
+async def get(
+    path: str,
+    params: dict = {},
+    session: Optional[aiohttp.ClientSession] = None
+) -> Optional[dict]:
+    if session is None:
+        async with aiohttp.ClientSession() as session:
+            return await get(path, params, session)
+
+    with metrics.span(f'lounge {path}'):
         async with session.get(url = BASE_URL + path, params = params) as response:
             if response.status != 200:
                 return None
@@ -80,6 +98,124 @@ async def get_lounger(
     return await get(path='/player', params=params)
 
 
+class PlayerResolver:
+    """looks up many players at once
+
+    Keys are deduplicated, recently found players come from the cache and
+    the rest are fetched over one session with at most `concurrency`
+    requests in flight. Results keep the order of the input. Calls are
+    recorded as `resolve players` in `metrics`.
+    """
+
+    PARAMS = {
+        'player_id': 'id',
+        'name': 'name',
+        'mkc_id': 'mkcId',
+        'discord_id': 'discordId',
+        'fc': 'fc'
+    }
+
+    def __init__(
+        self,
+        concurrency: int = 8,
+        ttl: float = 300.0,
+        max_entries: int = 4096
+    ) -> None:
+        self.concurrency: int = concurrency
+        self.ttl: float = ttl
+        self.max_entries: int = max_entries
+        self.hits: int = 0
+        self.misses: int = 0
+        self._cache: OrderedDict[tuple, tuple[float, dict]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def _get(self, key: tuple) -> Optional[dict]:
+        entry = self._cache.get(key)
+
+        if entry is None:
+            return None
+
+        if time.monotonic() - entry[0] > self.ttl:
+            self._cache.pop(key)
+            return None
+
+        self._cache.move_to_end(key)
+        return entry[1]
+
+    def _put(self, key: tuple, player: dict) -> None:
+        self._cache[key] = (time.monotonic(), player)
+        self._cache.move_to_end(key)
+
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last = False)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    @metrics.timed('resolve players')
+    async def resolve(
+        self,
+        by: str,
+        values: list[Any],
+        season: Optional[int] = None,
+        return_exceptions: bool = True
+    ) -> list[Optional[dict]]:
+        """
+        Args:
+            by (str): one of `PARAMS`
+            values (list[Any]): None is resolved to None
+            return_exceptions (bool): resolve failed requests to None instead of raising
+        """
+        found: dict[Any, Optional[dict]] = {}
+        missing: list[Any] = []
+
+        for value in dict.fromkeys(v for v in values if v is not None):
+            player = self._get((by, value, season))
+
+            if player is None:
+                missing.append(value)
+            else:
+                found[value] = player
+
+        self.hits += len(found)
+        self.misses += len(missing)
+
+        if missing:
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async with aiohttp.ClientSession() as session:
+
+                async def fetch(value: Any) -> Optional[dict]:
+                    params = {self.PARAMS[by]: value}
+
+                    if season is not None:
+                        params['season'] = season
+
+                    async with semaphore:
+                        try:
+                            return await get('/player', params, session)
+                        except (aiohttp.ClientError, asyncio.TimeoutError):
+                            if not return_exceptions:
+                                raise
+
+                            return None
+
+                players = await asyncio.gather(*[fetch(value) for value in missing])
+
+            for value, player in zip(missing, players):
+                found[value] = player
+
+                if player is not None:
+                    self._put((by, value, season), player)
+
+        return [found.get(v) if v is not None else None for v in values]
+
+
+player_resolver = PlayerResolver()
+
+
 async def get_player_info(
     player_id: Optional[int] = None,
     name: Optional[str] = None,
@@ -97,11 +233,13 @@ async def get_player_info(
     return await get(path='/player/details',params=params)
 
 
+@metrics.timed('gcs get')
 def get_data(path: str) -> dict:
     blob = bucket.blob(path)
     return json.loads(blob.download_as_string())
 
 
+@metrics.timed('gcs post')
 def post_data(path: str, params: dict) -> None:
     blob = bucket.blob(path)
     blob.upload_from_string(
@@ -125,35 +263,230 @@ def post_guild_info(guild_id: int, params: dict) -> None:
     return
 
 
-def get_results(guild_id: int) -> list[dict]:
-
+def get_results(guild_id: int, create: bool = True) -> list[dict]:
+    """
+    Args:
+        create (bool): store an empty results.json if the guild has none
+    """
     path = f'{guild_id}/results.json'
     try:
         return get_data(path)
     except NotFound:
-        post_data(path,INITIAL_RESULTS)
+        if create:
+            post_data(path,INITIAL_RESULTS)
         return INITIAL_RESULTS.copy()
 
 
-def post_results(guild_id: int, point: Point, enemy: str, dt: datetime) -> None:
-    result = get_results(guild_id)
-    result.append({
+def summarize(results: list[dict]) -> dict:
+    summary = {'total': INITIAL_SUMMARY['total'].copy(), 'enemies': {}}
+
+    for r in results:
+        update_summary(summary, r['score'], r['enemyScore'], r['enemy'])
+
+    return summary
+
+
+def update_summary(
+    summary: dict,
+    score: int,
+    enemy_score: int,
+    enemy: str,
+    count: int = 1
+) -> None:
+    """add (count=1) or remove (count=-1) a result
+    Args:
+        summary (dict): {'total': record, 'enemies': {enemy: record}}
+            record is [win, lose, draw, score, enemyScore]
+    """
+    score, enemy_score = int(score), int(enemy_score)
+    diff = score - enemy_score
+    i = 0 if diff > 0 else 1 if diff < 0 else 2
+    records = summary['enemies']
+
+    for record in (summary['total'], records.setdefault(enemy, [0, 0, 0, 0, 0])):
+        record[i] += count
+        record[3] += count * score
+        record[4] += count * enemy_score
+
+    if sum(records[enemy][:3]) <= 0:
+        records.pop(enemy)
+
+    return
+
+
+def result_revision(results: list[dict]) -> str:
+    """hash of the stored results, recorded in summary.json next to them"""
+    return hashlib.sha1(json.dumps(results).encode()).hexdigest()
+
+
+def get_summary(guild_id: int) -> dict:
+    """
+    Returns:
+        dict: see `update_summary`, plus 'revision' (`result_revision` of results.json
+            when it was written with `post_result_rows`) and 'count' (its length)
+    """
+    path = f'{guild_id}/summary.json'
+    try:
+        return get_data(path)
+    except NotFound:
+        return rebuild_summary(guild_id, get_results(guild_id))
+
+
+def post_summary(guild_id: int, summary: dict) -> None:
+    post_data(f'{guild_id}/summary.json', summary)
+    return
+
+
+def rebuild_summary(guild_id: int, results: list[dict]) -> dict:
+    """summarize `results` again and store it as their summary"""
+    summary = summarize(results)
+    summary['revision'] = result_revision(results)
+    summary['count'] = len(results)
+    post_summary(guild_id, summary)
+    return summary
+
+
+def post_result_rows(guild_id: int, results: list[dict], summary: dict) -> str:
+    """write results.json and its summary, which records their revision
+    Returns:
+        str: the new revision
+    """
+    summary['revision'] = result_revision(results)
+    summary['count'] = len(results)
+    post_data(path = f'{guild_id}/results.json', params = results)
+    post_summary(guild_id, summary)
+    return summary['revision']
+
+
+def to_record(point: Point, enemy: str, dt: datetime) -> dict:
+    return {
         'score': point.ally,
         'enemyScore': point.enemy,
         'enemy': enemy,
         'date': dt.astimezone(tz=ZoneInfo(key='Asia/Tokyo')).strftime('%Y-%m-%d %H:%M:%S')
-    })
+    }
+
+
+def result_key(score: int, enemy_score: int, enemy: str, date: str) -> str:
+    """identifies the result a race belongs to (`date` as '%Y-%m-%d %H:%M:%S')"""
+    return f'{date}|{int(score)}|{int(enemy_score)}|{enemy}'
+
+
+def post_results(guild_id: int, point: Point, enemy: str, dt: datetime) -> Optional[int]:
+    """Returns: position of the new result in date order (None if already registered)"""
+    result = get_results(guild_id)
+    record = to_record(point, enemy, dt)
+
+    if record in result:
+        return None
+
+    summary = get_summary(guild_id)
+    result.append(record)
     df = pd.DataFrame(result)
     df = df.copy()
     df['date'] = pd.to_datetime(df['date'], infer_datetime_format=True)
-    df.sort_values(by='date', ascending=True, inplace=True)
+    df.sort_values(by='date', ascending=True, inplace=True, kind='mergesort')
+    position = int(df.index.get_loc(len(result) - 1))
     df = df.copy()
     df['date'] = df['date'].astype(str)
     params = df.drop_duplicates().to_dict('records')
-    post_data(path = f'{guild_id}/results.json', params=params)
+    update_summary(summary, point.ally, point.enemy, enemy)
+    post_result_rows(guild_id, params, summary)
+    return position
+
+
+def get_races(guild_id: int) -> dict:
+    """columnar race log
+    Returns:
+        dict: 'key' (`result_key` of the result), 'date', 'track', 'rank', 'diff': columns of the same length
+            'stats': {track: [count, diff_sum, wins]}
+    """
+    try:
+        data = get_data(f'{guild_id}/races.json')
+    except NotFound:
+        return {k: v.copy() for k, v in INITIAL_RACES.items()}
+
+    if 'key' not in data:
+        data['key'] = [''] * len(data['date'])
+
+    return data
+
+
+def _add_race_stats(stats: dict[str, list[int]], track: str, diff: int, count: int = 1) -> None:
+    if not track:
+        return
+
+    s = stats.setdefault(track, [0, 0, 0])
+    s[0] += count
+    s[1] += count * diff
+    s[2] += count * int(diff > 0)
+
+    if s[0] <= 0:
+        stats.pop(track)
+
+
+def post_races(guild_id: int, races: list[Race], dt: datetime, key: str) -> None:
+    """append the races of a newly registered result"""
+    data = get_races(guild_id)
+    date = dt.astimezone(tz=ZoneInfo(key='Asia/Tokyo')).strftime('%Y-%m-%d %H:%M:%S')
+
+    for race in races:
+        track = '' if race.track is None else str(race.track)
+
+        if track and track not in Track.__members__:
+            logging.warning(f'Unknown track not logged: {track!r} (guild {guild_id})')
+            track = ''
+
+        point = race.point
+        diff = point.ally - point.enemy
+        data['key'].append(key)
+        data['date'].append(date)
+        data['track'].append(track)
+        data['rank'].append(str(race.rank))
+        data['diff'].append(diff)
+        _add_race_stats(data['stats'], track, diff)
+
+    post_data(path = f'{guild_id}/races.json', params = data)
+    return
+
+
+def rekey_races(
+    guild_id: int,
+    keys: Optional[dict[str, Optional[str]]] = None,
+    keep: Optional[set[str]] = None
+) -> None:
+    """follow deleted, edited or replaced results
+    Args:
+        keys (Optional[dict[str, Optional[str]]]): old key -> new key (None removes the races)
+        keep (Optional[set[str]]): if given, races of any other result are removed too
+            (races logged before keys were recorded are left alone)
+    """
+    keys = keys or {}
+    data = get_races(guild_id)
+    columns = ('key', 'date', 'track', 'rank', 'diff')
+    rows = list(zip(*[data[c] for c in columns]))
+    kept = []
+
+    for key, date, track, rank, diff in rows:
+        key = keys.get(key, key)
+
+        if key is None or (keep is not None and key and key not in keep):
+            _add_race_stats(data['stats'], track, diff, -1)
+            continue
+
+        kept.append((key, date, track, rank, diff))
+
+    if kept == rows:
+        return
+
+    for column, values in zip(columns, zip(*kept) if kept else [()] * len(columns)):
+        data[column] = list(values)
+
+    post_data(path = f'{guild_id}/races.json', params = data)
     return
 
 
+@metrics.timed('sheets read')
 def get_sheet(sheet_name: str) -> dict:
     ret = {}
     worksheet = sh.worksheet(sheet_name)
@@ -168,6 +501,7 @@ def get_sheet(sheet_name: str) -> dict:
 
 
 
+@metrics.timed('sheets write')
 def overwrite_sheet(sheet_name: str, values:list[list])->None:
     worksheet = sh.worksheet(sheet_name)
     worksheet.clear()
@@ -179,6 +513,7 @@ def overwrite_sheet(sheet_name: str, values:list[list])->None:
     return
 
 
+@metrics.timed('sheets read')
 def get_team_name(guild_id: int) -> Optional[str]:
     worksheet = sh.worksheet('team')
     guild_list = worksheet.get_all_values()
@@ -192,6 +527,19 @@ def get_team_name(guild_id: int) -> Optional[str]:
     return
 
 
+@metrics.timed('sheets read')
+def get_team_names() -> dict[int, str]:
+    """all registered team names with a single sheet read
+    (the first row wins, as in `get_team_name`)"""
+    ret = {}
+
+    for record in sh.worksheet('team').get_all_values():
+        if len(record) >= 2 and str(record[0]).isdecimal() and str(record[1]) != '':
+            ret.setdefault(int(record[0]), str(record[1]))
+
+    return ret
+
+
 def set_team_name(
     guild_id: int,
     team_name: str
@@ -288,12 +636,10 @@ async def get_players(
     if search_linked_id:
         discord_ids = get_linked_ids(discord_ids)
 
-    tasks = [asyncio.create_task(get_lounger(
-        discord_id = discord_id,
-        season = season
-    ))for discord_id in discord_ids]
-    players = await asyncio.gather(
-        *tasks,
+    players = await player_resolver.resolve(
+        'discord_id',
+        discord_ids,
+        season = season,
         return_exceptions = return_exceptions
     )
 
@@ -303,77 +649,5 @@ async def get_players(
     return players
 
 
-RANK_DATA = {
-            "Grandmaster": {
-                "color": 0xA3022C,
-                "url": "https://i.imgur.com/EWXzu2U.png"},
-            "Master": {
-                "color": 0xD9E1F2,
-                "url": "https://i.imgur.com/3yBab63.png"},
-            "Diamond": {
-                "color": 0xBDD7EE,
-                "url": "https://i.imgur.com/RDlvdvA.png"},
-            "Ruby":{
-                "color":0xD51C5E,
-                "url": "https://i.imgur.com/WU2NlJQ.png"},
-            "Sapphire": {
-                "color": 0x286CD3,
-                "url": "https://i.imgur.com/bXEfUSV.png"},
-            "Platinum": {
-                "color": 0x3FABB8,
-                "url": "https://i.imgur.com/8v8IjHE.png"},
-            "Gold": {
-                "color": 0xFFD966,
-                "url": "https://i.imgur.com/6yAatOq.png"},
-            "Silver": {
-                "color": 0xD9D9D9,
-                "url": "https://i.imgur.com/xgFyiYa.png"},
-            "Bronze": {
-                "color": 0xC65911,
-                "url": "https://i.imgur.com/DxFLvtO.png"},
-            "Iron": {
-                "color": 0x817876,
-                "url": "https://i.imgur.com/AYRMVEu.png"},
-        }
-
-
-
-def get_rank(mmr: Union[int, float]) -> str:
-    """season 8"""
-
-    if mmr >= 17000:
-        return "Grandmaster"
-    elif mmr >= 16000:
-        return "Master"
-    elif mmr >= 15000:
-        return "Diamond 2"
-    elif mmr >= 14000:
-        return "Diamond 1"
-    elif mmr >= 13000:
-        return "Ruby 2"
-    elif mmr >= 12000:
-        return "Ruby 1"
-    elif mmr >= 11000:
-        return "Sapphire 2"
-    elif mmr >= 10000:
-        return "Sapphire 1"
-    elif mmr >= 9000:
-        return "Platinum 2"
-    elif mmr >= 8000:
-        return "Platinum 1"
-    elif mmr >= 7000:
-        return "Gold 2"
-    elif mmr >= 6000:
-        return "Gold 1"
-    elif mmr >= 5000:
-        return "Silver 2"
-    elif mmr >= 4000:
-        return "Silver 1"
-    elif mmr >= 3000:
-        return "Bronze 2"
-    elif mmr >= 2000:
-        return "Bronze 1"
-    elif mmr >= 1000:
-        return "Iron 2"
-    else:
-        return "Iron 1"
+def get_rank(mmr: Union[int, float], season: Optional[int] = None) -> str:
+    return get_rank_table(season).get(mmr)
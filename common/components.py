@@ -4,29 +4,46 @@ from typing import TYPE_CHECKING, Any, Union, Optional
 from discord.embeds import Embed, EmptyEmbed
 from discord.utils import get
 from math import floor
-from .api import RANK_DATA, get_rank, get_players, get_team_name
+from .api import get_players, get_team_name
+from .rank_table import get_rank_table
+from .rank_icon import rank_icons
+from .player import to_players, average_mmr
+from .member_index import ensure_chunked
 
 if TYPE_CHECKING:
     from discord.embeds import MaybeEmpty
-    from discord import Guild, Role
+    from discord import Guild, Role, File
 
 
 class LoungeEmbed(Embed):
 
-    def __init__(
-        self,
+    rank: str
+    mmr: Union[int, float]
+
+    @classmethod
+    def create(
+        cls,
         mmr: Union[int, float],
         title: MaybeEmpty[Any] = EmptyEmbed,
-        description: MaybeEmpty[Any] = EmptyEmbed
-    ) -> None:
-        self.rank: str = get_rank(mmr)
-        self.mmr: Union[int, float] = mmr
-        super().__init__(
-            title = title,
-            description = description,
-            color = RANK_DATA[self.rank.split(' ')[0]]['color']
-        )
-        self.set_thumbnail(url = RANK_DATA[self.rank.split(' ')[0]]['url'])
+        description: MaybeEmpty[Any] = EmptyEmbed,
+        season: Optional[int] = None
+    ) -> LoungeEmbed:
+        """clone the template of the rank of `mmr` and fill it in"""
+        table = get_rank_table(season)
+        rank = table.get(mmr)
+        template = rank_icons.template(table, rank)
+        e = cls.from_dict({**template, 'thumbnail': dict(template['thumbnail'])})
+        e.title = title
+        e.description = description
+        e.rank = rank
+        e.mmr = mmr
+        return e
+
+
+    @property
+    def file(self) -> Optional[File]:
+        """attachment the thumbnail refers to (a new one each time, send it with the embed)"""
+        return rank_icons.file(self.rank)
 
 
 
@@ -46,23 +63,15 @@ async def mkmg(
     if role is None:
         return header + body
 
-    players: list[dict] = await get_players(
+    await ensure_chunked(guild)
+    players = to_players(await get_players(
         discord_ids = [m.id for m in role.members],
         remove_None = True
-    )
-    count = 0
-    total_mmr = 0
-
-    for player in players:
-
-        try:
-            total_mmr += player['mmr']
-            count += 1
-        except KeyError:
-            pass
+    ))
+    average = average_mmr(players)
 
-    if  count == 0:
+    if average is None:
         return header + body
 
-    header += f'平均MMR {floor(total_mmr/(count*500))*500}程度\n'
+    header += f'平均MMR {floor(average/500)*500}程度\n'
     return header + body
@@ -0,0 +1,200 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Optional
+from bisect import bisect_left
+import asyncio
+import sys
+
+from .utils import normalize
+
+if TYPE_CHECKING:
+    from discord import Guild, Member
+
+
+def member_names(member: Member) -> set[str]:
+    """normalized names `member` can be found by"""
+    names = {member.name, member.nick, getattr(member, 'global_name', None)}
+    return {normalize(n) for n in names if n}
+
+
+class MemberIndex:
+    """normalized name -> member ids of one guild"""
+
+    __slots__ = (
+        'names',
+        'members',
+        '_sorted'
+    )
+
+    def __init__(self) -> None:
+        self.names: dict[str, set[int]] = {}
+        self.members: dict[int, tuple[str, ...]] = {}
+        self._sorted: Optional[list[str]] = None
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    @classmethod
+    def build(cls, members: list[Member]) -> MemberIndex:
+        index = cls()
+
+        for member in members:
+            index.add(member)
+
+        return index
+
+    def add(self, member: Member) -> None:
+        keys = tuple(member_names(member))
+        self.members[member.id] = keys
+
+        for key in keys:
+            if key not in self.names:
+                self._sorted = None
+            self.names.setdefault(key, set()).add(member.id)
+
+    def remove(self, member_id: int) -> None:
+        for key in self.members.pop(member_id, ()):
+            ids = self.names.get(key)
+
+            if ids is None:
+                continue
+
+            ids.discard(member_id)
+
+            if not ids:
+                self.names.pop(key)
+                self._sorted = None
+
+    def update(self, member: Member) -> None:
+        if self.members.get(member.id) != tuple(member_names(member)):
+            self.remove(member.id)
+            self.add(member)
+
+    def get(self, name: str) -> set[int]:
+        return self.names.get(normalize(name), set())
+
+    def prefix(self, name: str, limit: int = 25) -> list[int]:
+        """ids of members with a name starting with `name`, by name"""
+        key = normalize(name)
+
+        if self._sorted is None:
+            self._sorted = sorted(self.names)
+
+        ret: list[int] = []
+
+        for j in range(bisect_left(self._sorted, key), len(self._sorted)):
+            name = self._sorted[j]
+
+            if not name.startswith(key) or len(ret) >= limit:
+                break
+            ret.extend(i for i in self.names[name] if i not in ret)
+
+        return ret[:limit]
+
+    def memory(self) -> int:
+        """approximate size in bytes"""
+        size = sys.getsizeof(self.names) + sys.getsizeof(self.members)
+        size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in self.names.items())
+        size += sum(sys.getsizeof(v) for v in self.members.values())
+
+        if self._sorted is not None:
+            size += sys.getsizeof(self._sorted)
+
+        return size
+
+
+class MemberIndexes:
+    """member name index per guild, built on first use and kept current by member events"""
+
+    def __init__(self) -> None:
+        self._guilds: dict[int, MemberIndex] = {}
+
+    def get(self, guild: Guild) -> MemberIndex:
+        index = self._guilds.get(guild.id)
+
+        if index is None:
+            index = self._guilds[guild.id] = MemberIndex.build(guild.members)
+
+        return index
+
+    def find(self, guild: Guild, name: str) -> Optional[Member]:
+        """like `Guild.get_member_named`, but case and width insensitive
+
+        An exact name is preferred when several members share the normalized one.
+        """
+        members = [m for m in map(guild.get_member, self.get(guild).get(name)) if m is not None]
+
+        for member in members:
+            if name in (member.name, member.nick, getattr(member, 'global_name', None)):
+                return member
+
+        if members:
+            return members[0]
+
+        if '#' in name:
+            return guild.get_member_named(name)
+
+        return None
+
+    def search(self, guild: Guild, name: str, limit: int = 25) -> list[Member]:
+        members = map(guild.get_member, self.get(guild).prefix(name, limit))
+        return [m for m in members if m is not None]
+
+    def add(self, member: Member) -> None:
+        index = self._guilds.get(member.guild.id)
+
+        if index is not None:
+            index.add(member)
+
+    def remove(self, member: Member) -> None:
+        index = self._guilds.get(member.guild.id)
+
+        if index is not None:
+            index.remove(member.id)
+
+    def update(self, member: Member) -> None:
+        index = self._guilds.get(member.guild.id)
+
+        if index is not None:
+            index.update(member)
+
+    def forget(self, guild_id: int) -> None:
+        self._guilds.pop(guild_id, None)
+
+    def memory(self) -> dict[int, int]:
+        """approximate size in bytes per guild"""
+        return {guild_id: index.memory() for guild_id, index in self._guilds.items()}
+
+
+member_index = MemberIndexes()
+
+
+_chunked: set[int] = set()
+_chunking: dict[int, asyncio.Task] = {}
+
+
+async def _chunk(guild: Guild) -> None:
+    await guild.chunk(cache = True)
+    _chunked.add(guild.id)
+    member_index.forget(guild.id)
+
+
+async def ensure_chunked(guild: Optional[Guild]) -> None:
+    """load every member of `guild` into the cache the first time something needs them
+
+    With chunking at startup disabled, only guilds that use role members,
+    member fields or name lookups are chunked.
+    """
+    if guild is None or guild.id in _chunked or guild.chunked:
+        return
+
+    task = _chunking.get(guild.id)
+
+    if task is None:
+        task = _chunking[guild.id] = asyncio.create_task(_chunk(guild))
+        task.add_done_callback(lambda _: _chunking.pop(guild.id, None))
+
+    await task
+
+
+def forget_chunked(guild_id: int) -> None:
+    _chunked.discard(guild_id)
@@ -0,0 +1,146 @@
+from __future__ import annotations
+from typing import Any, Callable, Iterator, Optional, TypeVar
+from collections import deque
+from contextlib import contextmanager
+from aiohttp import web
+import numpy as np
+import asyncio
+import functools
+import threading
+import logging
+import time
+
+F = TypeVar('F', bound=Callable[..., Any])
+
+
+class Metrics:
+    """invocation counts, latencies and errors per name
+
+    Names are `slash <command>`, `prefix <command>` and `listener <name>` for
+    the bot's own handlers, and `lounge`, `gcs`, `sheets` and `discord` spans
+    for external calls. Latency percentiles are computed over the last
+    `history` observations of each name.
+    """
+
+    def __init__(self, history: int = 512) -> None:
+        self.history: int = history
+        self.counts: dict[str, int] = {}
+        self.totals: dict[str, float] = {}
+        self.errors: dict[tuple[str, str], int] = {}
+        self._times: dict[str, deque[float]] = {}
+        self._lock: threading.Lock = threading.Lock()
+        self._runner: Optional[web.AppRunner] = None
+
+    def observe(self, name: str, seconds: float) -> None:
+        # spans also close in worker threads (asyncio.to_thread, the graph renderer)
+        with self._lock:
+            times = self._times.get(name)
+
+            if times is None:
+                times = self._times[name] = deque(maxlen = self.history)
+
+            times.append(seconds)
+            self.counts[name] = self.counts.get(name, 0) + 1
+            self.totals[name] = self.totals.get(name, 0.0) + seconds
+
+    def error(self, name: str, error: BaseException) -> None:
+        key = (name, type(error).__name__)
+
+        with self._lock:
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+
+        try:
+            yield
+        except Exception as e:
+            self.error(name, e)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timed(self, name: str) -> Callable[[F], F]:
+        """decorator recording every call of a function (or coroutine function) under `name`"""
+
+        def decorator(func: F) -> F:
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def wrapper(*args, **kwargs):
+                    with self.span(name):
+                        return await func(*args, **kwargs)
+            else:
+                @functools.wraps(func)
+                def wrapper(*args, **kwargs):
+                    with self.span(name):
+                        return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        ret: dict[str, dict[str, float]] = {}
+
+        with self._lock:
+            times = {name: list(t) for name, t in self._times.items()}
+            counts = dict(self.counts)
+            totals = dict(self.totals)
+            errors = dict(self.errors)
+
+        for name, t in times.items():
+            p50, p95, p99 = np.percentile(np.array(t) * 1000, [50, 95, 99])
+            ret[name] = {
+                'count': counts[name],
+                'errors': sum(c for (n, _), c in errors.items() if n == name),
+                'total_s': totals[name],
+                'p50_ms': p50,
+                'p95_ms': p95,
+                'p99_ms': p99
+            }
+
+        return ret
+
+    def render(self) -> str:
+        """Prometheus text format"""
+        stats = self.stats()
+
+        with self._lock:
+            errors = dict(self.errors)
+
+        lines = ['# TYPE bot_call_seconds summary']
+
+        for name, s in stats.items():
+            label = f'name="{name}"'
+
+            for q in ('50', '95', '99'):
+                lines.append(f'bot_call_seconds{{{label},quantile="0.{q}"}} {s[f"p{q}_ms"]/1000:.6f}')
+
+            lines.append(f'bot_call_seconds_sum{{{label}}} {s["total_s"]:.6f}')
+            lines.append(f'bot_call_seconds_count{{{label}}} {s["count"]}')
+
+        lines.append('# TYPE bot_errors_total counter')
+
+        for (name, error), count in errors.items():
+            lines.append(f'bot_errors_total{{name="{name}",type="{error}"}} {count}')
+
+        return '\n'.join(lines) + '\n'
+
+    async def serve(self, port: int, host: str = '127.0.0.1') -> None:
+        """serve `render` at http://host:port/metrics"""
+        if self._runner is not None:
+            return
+
+        async def handler(request: web.Request) -> web.Response:
+            return web.Response(text = self.render())
+
+        app = web.Application()
+        app.router.add_get('/metrics', handler)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logging.info(f'Serving metrics on http://{host}:{port}/metrics')
+
+
+metrics = Metrics()
@@ -0,0 +1,72 @@
+from __future__ import annotations
+from typing import Iterable, Optional
+
+
+class Player:
+    """the fields of a Lounge player the team commands use"""
+
+    __slots__ = (
+        'id',
+        'name',
+        'mmr',
+        'registry_id',
+        'switch_fc'
+    )
+
+    def __init__(
+        self,
+        id: int,
+        name: str,
+        mmr: Optional[int] = None,
+        registry_id: Optional[int] = None,
+        switch_fc: Optional[str] = None
+    ):
+        self.id: int = id
+        self.name: str = name
+        self.mmr: Optional[int] = mmr
+        self.registry_id: Optional[int] = registry_id
+        self.switch_fc: Optional[str] = switch_fc
+
+
+    @staticmethod
+    def from_dict(data: dict) -> Player:
+        return Player(
+            id = data['id'],
+            name = data['name'],
+            mmr = data.get('mmr'),
+            registry_id = data.get('registryId'),
+            switch_fc = data.get('switchFc')
+        )
+
+
+def to_players(data: Iterable[Optional[dict]]) -> list[Optional[Player]]:
+    return [Player.from_dict(d) if d is not None else None for d in data]
+
+
+def unique_players(players: Iterable[Player]) -> list[Player]:
+    """first player of each name, in order"""
+    seen: set[str] = set()
+    ret: list[Player] = []
+
+    for player in players:
+        if player.name not in seen:
+            seen.add(player.name)
+            ret.append(player)
+
+    return ret
+
+
+def sort_by_mmr(players: Iterable[Player], reverse: bool = True) -> list[Player]:
+    """players with MMR sorted by it, followed by placement players"""
+    players = list(players)
+    rated = sorted([p for p in players if p.mmr is not None], key = lambda p: p.mmr, reverse = reverse)
+    return rated + [p for p in players if p.mmr is None]
+
+
+def average_mmr(players: Iterable[Player]) -> Optional[float]:
+    mmrs = [p.mmr for p in players if p.mmr is not None]
+
+    if not mmrs:
+        return None
+
+    return sum(mmrs) / len(mmrs)
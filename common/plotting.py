@@ -1,29 +1,312 @@
-import matplotlib.pyplot as plt
+from __future__ import annotations
+from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from matplotlib.figure import Figure
+import multiprocessing
+import hashlib
+import os
 import pandas as pd
 import numpy as np
+import asyncio
+import functools
 from io import BytesIO
 
-def result_graph(df: pd.DataFrame) -> BytesIO:
-    xs = np.arange(len(df))
-    plt.rcParams.update(plt.rcParamsDefault)
-    lines = plt.plot(
-        np.sign(df['score'] - df['enemyScore']).cumsum(),
-        label = 'Wins - Loses'
-    )
-    plt.setp(lines, color = 'green', linewidth = 1.0)
-    _, _, ymin, ymax = plt.axis()
-    plt.grid(visible = True, which = 'both', axis = 'both', color = 'gray', linestyle = ':')
-    plt.legend(
-        bbox_to_anchor = (0, 1),
-        loc = 'upper left',
-        borderaxespad = 0.5
-    )
-    plt.fill_between(xs, ymin, 0, facecolor = '#87ceeb', alpha = 0.3)
-    plt.fill_between(xs, 0, ymax, facecolor = '#ffa07a', alpha = 0.3)
-    plt.title('Win&Lose History')
+from .metrics import metrics
+
+
+class RendererBusy(Exception):
+    pass
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """mean of the last `window` values (fewer at the head)"""
+    c = np.cumsum(values, dtype = np.float64)
+    c[window:] = c[window:] - c[:-window]
+    return c / np.minimum(np.arange(1, len(c)+1), window)
+
+
+def compute_series(
+    scores: np.ndarray,
+    enemy_scores: np.ndarray,
+    window: int = 10
+) -> dict[str, np.ndarray]:
+    diff = scores.astype(np.int64) - enemy_scores
+    sign = np.sign(diff)
+    return {
+        'wl': sign.cumsum(),
+        'rate': rolling_mean(sign > 0, window) * 100,
+        'diff': rolling_mean(diff, window)
+    }
+
+
+def downsample(ys: np.ndarray, n_out: int) -> tuple[np.ndarray, np.ndarray]:
+    """keep the first, last, min and max point of each bucket
+    Returns:
+        tuple[np.ndarray, np.ndarray]: x (index in `ys`), y
+    """
+    n = len(ys)
+
+    if n <= n_out:
+        return np.arange(n), ys
+
+    size = -(-n // max(n_out // 2, 1))
+    padded = np.concatenate([ys, np.repeat(ys[-1:], (-n) % size)]).reshape(-1, size)
+    base = np.arange(len(padded)) * size
+    xs = np.unique(np.concatenate([
+        base + padded.argmin(axis = 1),
+        base + padded.argmax(axis = 1),
+        [0, n-1]
+    ]))
+    xs = xs[xs < n]
+    return xs, ys[xs]
+
+
+def render_png(
+    scores: np.ndarray,
+    enemy_scores: np.ndarray,
+    window: int = 10,
+    title: str = 'Win&Lose History'
+) -> bytes:
+    """draw Win&Lose History without touching pyplot's global state"""
+    series = compute_series(scores, enemy_scores, window)
+    fig = Figure(figsize = (8, 7))
+    width = int(fig.get_figwidth() * fig.dpi)
+    ax1, ax2, ax3 = fig.subplots(3, 1, sharex = True, gridspec_kw = {'height_ratios': [2, 1, 1]})
+
+    xs, ys = downsample(series['wl'], width)
+    ax1.plot(xs, ys, color = 'green', linewidth = 1.0, label = 'Wins - Loses')
+    ymin, ymax = ax1.get_ylim()
+    ax1.axhspan(ymin, 0, facecolor = '#87ceeb', alpha = 0.3)
+    ax1.axhspan(0, ymax, facecolor = '#ffa07a', alpha = 0.3)
+    ax1.set_ylim(ymin, ymax)
+    ax1.set_title(title)
+
+    xs, ys = downsample(series['rate'], width)
+    ax2.plot(xs, ys, color = 'orange', linewidth = 1.0, label = f'Win rate (last {window}) %')
+    ax2.axhline(50, color = 'gray', linewidth = 0.8)
+    ax2.set_ylim(-5, 105)
+
+    xs, ys = downsample(series['diff'], width)
+    ax3.plot(xs, ys, color = 'purple', linewidth = 1.0, label = f'Diff (last {window})')
+    ax3.axhline(0, color = 'gray', linewidth = 0.8)
+
+    for ax in (ax1, ax2, ax3):
+        ax.grid(visible = True, which = 'both', axis = 'both', color = 'gray', linestyle = ':')
+        ax.legend(
+            bbox_to_anchor = (0, 1),
+            loc = 'upper left',
+            borderaxespad = 0.5
+        )
+
     buffer = BytesIO()
-    plt.savefig(buffer, format='png', bbox_inches = 'tight')
-    buffer.seek(0)
-    plt.clf()
-    plt.close()
-    return buffer
\ No newline at end of file
+    fig.savefig(buffer, format='png', bbox_inches = 'tight')
+    return buffer.getvalue()
+
+
+def result_graph(df: pd.DataFrame) -> BytesIO:
+    return BytesIO(render_png(df['score'].to_numpy(), df['enemyScore'].to_numpy()))
+
+
+class GraphRenderer:
+    """renders graphs in worker processes so the event loop keeps running
+
+    Workers are started from a forkserver rather than forked from the bot,
+    so they never inherit the event loop's threads or sockets. A slot stays
+    taken until its worker has actually finished, even after a timeout.
+    Latencies, rejections and timeouts are recorded as `render graph`
+    in `metrics`.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 2,
+        max_queue: int = 8,
+        timeout: float = 20.0
+    ) -> None:
+        self.max_workers: int = max_workers
+        self.max_queue: int = max_queue
+        self.timeout: float = timeout
+        self._pending: int = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers = self.max_workers,
+                mp_context = multiprocessing.get_context('forkserver')
+            )
+        return self._executor
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @metrics.timed('render graph')
+    async def render(self, df: pd.DataFrame, title: str = 'Win&Lose History') -> BytesIO:
+        """
+        Raises:
+            RendererBusy: queue is full
+            asyncio.TimeoutError: rendering took longer than `timeout`
+        """
+        if self._pending >= self.max_queue:
+            raise RendererBusy
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self.executor,
+            functools.partial(
+                render_png,
+                df['score'].to_numpy(),
+                df['enemyScore'].to_numpy(),
+                title = title
+            )
+        )
+        self._pending += 1
+        future.add_done_callback(self._release)
+
+        data = await asyncio.wait_for(asyncio.shield(future), timeout = self.timeout)
+        return BytesIO(data)
+
+    def _release(self, future: asyncio.Future) -> None:
+        self._pending -= 1
+
+        if not future.cancelled():
+            future.exception()
+
+        return
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait = False, cancel_futures = True)
+            self._executor = None
+
+
+class GraphCache:
+    """latest rendered graph per key (guild and period)
+
+    Entries are reused while the guild's result revision (stored in its
+    summary.json) is unchanged and, after a restart or a no-op write, while
+    the plotted results hash the same. Files of dropped entries are deleted.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 32 * 1024 * 1024,
+        directory: Optional[str] = None
+    ) -> None:
+        self.max_bytes: int = max_bytes
+        self.directory: Optional[str] = directory
+        self.hits: int = 0
+        self.misses: int = 0
+        self._size: int = 0
+        self._entries: OrderedDict[str, tuple[Optional[str], str, bytes]] = OrderedDict()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @staticmethod
+    def digest(df: pd.DataFrame) -> str:
+        h = hashlib.sha1()
+
+        for column in ('score', 'enemyScore'):
+            h.update(np.ascontiguousarray(df[column].to_numpy(dtype = np.int64)).tobytes())
+
+        return h.hexdigest()
+
+    def _path(self, key: str, digest: str) -> str:
+        return os.path.join(self.directory, f'{key}-{digest}.png')
+
+    def get(self, key: str, revision: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+
+        if entry is None or entry[0] != revision:
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def lookup(self, key: str, revision: Optional[str], digest: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+
+        if entry is not None and entry[1] == digest:
+            self._entries[key] = (revision, digest, entry[2])
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+        if self.directory is not None:
+            try:
+                with open(self._path(key, digest), 'rb') as f:
+                    data = f.read()
+                self._store(key, revision, digest, data)
+                self.hits += 1
+                return data
+            except OSError:
+                pass
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, revision: Optional[str], digest: str, data: bytes) -> None:
+        if self.directory is not None:
+            try:
+                os.makedirs(self.directory, exist_ok = True)
+                with open(self._path(key, digest), 'wb') as f:
+                    f.write(data)
+
+                for name in os.listdir(self.directory):
+                    if name.startswith(f'{key}-') and name != f'{key}-{digest}.png':
+                        os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+        self._store(key, revision, digest, data)
+        return
+
+    def _store(self, key: str, revision: Optional[str], digest: str, data: bytes) -> None:
+        entry = self._entries.get(key)
+        self.invalidate(key, keep_file = entry is None or entry[1] == digest)
+
+        if len(data) > self.max_bytes:
+            self._remove_file(key, digest)
+            return
+
+        self._entries[key] = (revision, digest, data)
+        self._size += len(data)
+
+        while self._size > self.max_bytes:
+            old_key, (_, old_digest, old) = self._entries.popitem(last = False)
+            self._size -= len(old)
+            self._remove_file(old_key, old_digest)
+
+        return
+
+    def _remove_file(self, key: str, digest: str) -> None:
+        if self.directory is None:
+            return
+
+        try:
+            os.remove(self._path(key, digest))
+        except OSError:
+            pass
+
+    def invalidate(self, key: str, keep_file: bool = False) -> None:
+        entry = self._entries.pop(key, None)
+
+        if entry is None:
+            return
+
+        self._size -= len(entry[2])
+
+        if not keep_file:
+            self._remove_file(key, entry[1])
+
+        return
+
+
+graph_renderer = GraphRenderer()
+graph_cache = GraphCache()
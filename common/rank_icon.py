@@ -0,0 +1,70 @@
+from __future__ import annotations
+from typing import Any, Optional
+from discord import Embed, File
+from io import BytesIO
+import logging
+import os
+
+from .rank_table import RANK_DATA, RANK_TABLES, RankTable
+
+ASSET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets', 'ranks')
+
+
+class RankIcons:
+    """bundled rank icons as bytes and an embed template per rank
+
+    Icons are read once from `directory` (common/assets/ranks, committed with
+    the code) and never written. Templates carry the colour and thumbnail of
+    a rank and are cloned by `LoungeEmbed.create`. The remote URL is used only
+    for a division whose icon is missing.
+    """
+
+    def __init__(self, directory: str = ASSET_DIR) -> None:
+        self.directory: str = directory
+        self._data: dict[str, bytes] = {}
+        self._templates: dict[tuple[int, str], dict[str, Any]] = {}
+
+        for division in RANK_DATA.keys():
+            try:
+                with open(os.path.join(self.directory, RankIcons.filename(division)), 'rb') as f:
+                    self._data[division] = f.read()
+            except OSError:
+                logging.warning(f'Rank icon is not bundled: {division}')
+
+        for table in RANK_TABLES.values():
+            for rank in table.names:
+                embed = Embed(color = table.color(rank))
+                embed.set_thumbnail(url = self.thumbnail_url(rank))
+                self._templates[(table.season, rank)] = embed.to_dict()
+
+    @staticmethod
+    def filename(division: str) -> str:
+        return f'{division.lower()}.png'
+
+    def get(self, division: str) -> Optional[bytes]:
+        return self._data.get(division)
+
+    def template(self, table: RankTable, rank: str) -> dict[str, Any]:
+        """embed dict with the colour and thumbnail of `rank` (copy it before changing it)"""
+        return self._templates[(table.season, rank)]
+
+    def thumbnail_url(self, rank: str) -> str:
+        """attachment URL if the icon is bundled, else the remote one"""
+        division = RankTable.division(rank)
+
+        if division not in self._data:
+            return RANK_DATA[division]['url']
+
+        return f'attachment://{RankIcons.filename(division)}'
+
+    def file(self, rank: str) -> Optional[File]:
+        division = RankTable.division(rank)
+        data = self._data.get(division)
+
+        if data is None:
+            return None
+
+        return File(BytesIO(data), filename = RankIcons.filename(division))
+
+
+rank_icons = RankIcons()
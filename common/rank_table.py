@@ -0,0 +1,128 @@
+from __future__ import annotations
+from typing import Optional, Union
+from bisect import bisect_right
+import numpy as np
+
+
+RANK_DATA = {
+            "Grandmaster": {
+                "color": 0xA3022C,
+                "url": "https://i.imgur.com/EWXzu2U.png"},
+            "Master": {
+                "color": 0xD9E1F2,
+                "url": "https://i.imgur.com/3yBab63.png"},
+            "Diamond": {
+                "color": 0xBDD7EE,
+                "url": "https://i.imgur.com/RDlvdvA.png"},
+            "Ruby":{
+                "color":0xD51C5E,
+                "url": "https://i.imgur.com/WU2NlJQ.png"},
+            "Sapphire": {
+                "color": 0x286CD3,
+                "url": "https://i.imgur.com/bXEfUSV.png"},
+            "Platinum": {
+                "color": 0x3FABB8,
+                "url": "https://i.imgur.com/8v8IjHE.png"},
+            "Gold": {
+                "color": 0xFFD966,
+                "url": "https://i.imgur.com/6yAatOq.png"},
+            "Silver": {
+                "color": 0xD9D9D9,
+                "url": "https://i.imgur.com/xgFyiYa.png"},
+            "Bronze": {
+                "color": 0xC65911,
+                "url": "https://i.imgur.com/DxFLvtO.png"},
+            "Iron": {
+                "color": 0x817876,
+                "url": "https://i.imgur.com/AYRMVEu.png"},
+        }
+
+
+class UnknownSeason(Exception):
+    pass
+
+
+class RankTable:
+    """lower MMR bound of every rank in a season"""
+
+    __slots__ = (
+        'season',
+        'thresholds',
+        'names',
+        '_thresholds',
+        '_names'
+    )
+
+    def __init__(self, season: int, ranks: list[tuple[int, str]]):
+        ranks = sorted(ranks)
+        self.season: int = season
+        self.thresholds: list[int] = [mmr for mmr, _ in ranks]
+        self.names: list[str] = [name for _, name in ranks]
+        self._thresholds: np.ndarray = np.array(self.thresholds)
+        self._names: np.ndarray = np.array(self.names, dtype = object)
+
+
+    def get(self, mmr: Union[int, float]) -> str:
+        return self.names[max(bisect_right(self.thresholds, mmr) - 1, 0)]
+
+
+    def get_many(self, mmrs: np.ndarray) -> np.ndarray:
+        """rank names of every MMR in one pass"""
+        index = np.searchsorted(self._thresholds, np.asarray(mmrs), side = 'right') - 1
+        return self._names[np.maximum(index, 0)]
+
+
+    @staticmethod
+    def division(rank: str) -> str:
+        return rank.split(' ')[0]
+
+
+    def color(self, rank: str) -> int:
+        return RANK_DATA[RankTable.division(rank)]['color']
+
+
+    def icon_url(self, rank: str) -> str:
+        return RANK_DATA[RankTable.division(rank)]['url']
+
+
+def _ranks(divisions: list[tuple[str, int]], step: int = 1000) -> list[tuple[int, str]]:
+    """divisions from the bottom, each with its number of tiers"""
+    ranks: list[tuple[int, str]] = []
+
+    for division, tiers in divisions:
+        for tier in range(tiers):
+            name = f'{division} {tier+1}' if tiers > 1 else division
+            ranks.append((len(ranks) * step, name))
+
+    return ranks
+
+
+RANK_TABLES: dict[int, RankTable] = {
+    8: RankTable(8, _ranks([
+        ('Iron', 2),
+        ('Bronze', 2),
+        ('Silver', 2),
+        ('Gold', 2),
+        ('Platinum', 2),
+        ('Sapphire', 2),
+        ('Ruby', 2),
+        ('Diamond', 2),
+        ('Master', 1),
+        ('Grandmaster', 1)
+    ]))
+}
+LATEST_SEASON: int = max(RANK_TABLES)
+
+
+def get_rank_table(season: Optional[int] = None) -> RankTable:
+    """table of `season` (the latest season if None)
+    Raises:
+        UnknownSeason: no table is defined for `season`
+    """
+    if season is None:
+        return RANK_TABLES[LATEST_SEASON]
+
+    try:
+        return RANK_TABLES[season]
+    except KeyError:
+        raise UnknownSeason(f'No rank table for season {season} (known: {sorted(RANK_TABLES)})')
@@ -0,0 +1,211 @@
+from __future__ import annotations
+from typing import Any, Awaitable, Callable, Optional
+from datetime import datetime
+from google.cloud.exceptions import NotFound
+import itertools
+import asyncio
+import logging
+import heapq
+import time
+
+from .api import get_data, post_data
+
+Handler = Callable[[dict[str, Any]], Awaitable[None]]
+
+
+class Scheduler:
+    """one timer for every scheduled job, persisted to storage
+
+    Jobs are kept in a heap ordered by due time. A single task sleeps until
+    the earliest job is due (or an earlier one is added) and dispatches every
+    due job to the handler registered for its kind. A dispatched job stays
+    stored until its handler finishes, so a restart runs it again. Changes
+    are written back at most once per `save_delay` seconds, in a thread, and
+    not before the stored jobs have been loaded.
+    """
+
+    def __init__(self, path: str = 'scheduler.json', save_delay: float = 1.0) -> None:
+        self.path: str = path
+        self.save_delay: float = save_delay
+        self._heap: list[tuple[float, int, str, dict[str, Any]]] = []
+        self._handlers: dict[str, Handler] = {}
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._saver: Optional[asyncio.Task] = None
+        self._dirty: bool = False
+        self._loaded: bool = False
+        self._running: dict[int, tuple[float, int, str, dict[str, Any]]] = {}
+        self._calls: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def register(self, kind: str, handler: Handler) -> None:
+        self._handlers[kind] = handler
+
+    def add(
+        self,
+        when: datetime,
+        kind: str,
+        payload: dict[str, Any],
+        save: bool = True
+    ) -> None:
+        self.add_many([(when, kind, payload)], save)
+
+    def add_many(
+        self,
+        jobs: list[tuple[datetime, str, dict[str, Any]]],
+        save: bool = True
+    ) -> None:
+        if not jobs:
+            return
+
+        earliest = self._heap[0][0] if self._heap else None
+
+        for when, kind, payload in jobs:
+            heapq.heappush(self._heap, (when.timestamp(), next(self._seq), kind, payload))
+
+        if save:
+            self.save()
+
+        if self._wakeup is not None and (earliest is None or self._heap[0][0] < earliest):
+            self._wakeup.set()
+
+    def cancel(self, kind: Optional[str] = None, **match: Any) -> int:
+        """remove jobs whose payload contains every item of `match`"""
+        kept = [
+            job for job in self._heap
+            if not ((kind is None or job[2] == kind) and all(job[3].get(k) == v for k, v in match.items()))
+        ]
+        removed = len(self._heap) - len(kept)
+        running = [
+            seq for seq, job in self._running.items()
+            if (kind is None or job[2] == kind) and all(job[3].get(k) == v for k, v in match.items())
+        ]
+
+        for seq in running:
+            self._running.pop(seq)
+
+        if removed:
+            heapq.heapify(kept)
+            self._heap = kept
+
+        if removed or running:
+            self.save()
+
+        return removed
+
+    def jobs(self, kind: Optional[str] = None) -> list[tuple[float, str, dict[str, Any]]]:
+        return [(when, k, payload) for when, _, k, payload in sorted(self._heap) if kind is None or k == kind]
+
+    async def load(self) -> None:
+        """merge the stored jobs into the ones added since startup"""
+        try:
+            data = await asyncio.to_thread(get_data, self.path)
+        except NotFound:
+            data = []
+
+        known = [(when, kind, payload) for when, _, kind, payload in self._heap]
+
+        for when, kind, payload in data:
+            if (float(when), kind, payload) not in known:
+                heapq.heappush(self._heap, (float(when), next(self._seq), kind, payload))
+
+        self._loaded = True
+
+        if self._dirty:
+            self.save()
+
+    def save(self) -> None:
+        self._dirty = True
+
+        if not self._loaded:
+            return
+
+        if self._saver is not None and not self._saver.done():
+            return
+
+        try:
+            self._saver = asyncio.get_running_loop().create_task(self._flush())
+        except RuntimeError:
+            self._dirty = False
+            post_data(self.path, self._dump())
+
+    def _dump(self) -> list[list[Any]]:
+        return [[when, kind, payload] for when, _, kind, payload in sorted([*self._heap, *self._running.values()])]
+
+    async def _flush(self) -> None:
+        while self._dirty:
+            await asyncio.sleep(self.save_delay)
+            self._dirty = False
+
+            try:
+                await asyncio.to_thread(post_data, self.path, self._dump())
+            except Exception:
+                logging.exception(f'Failed to save scheduled jobs: {self.path}')
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        if not self._loaded:
+            try:
+                await self.load()
+            except Exception:
+                # saving now would overwrite the stored jobs with only the new ones
+                logging.exception(f'Failed to load scheduled jobs, changes will not be saved: {self.path}')
+
+        while True:
+            if not self._heap:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            delay = self._heap[0][0] - time.time()
+
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout = delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            now = time.time()
+
+            while self._heap and self._heap[0][0] <= now:
+                job = heapq.heappop(self._heap)
+                handler = self._handlers.get(job[2])
+
+                if handler is None:
+                    logging.warning(f'No handler for scheduled job: {job[2]}')
+                    self.save()
+                    continue
+
+                self._running[job[1]] = job
+                task = asyncio.create_task(self._call(handler, job))
+                self._calls.add(task)
+                task.add_done_callback(self._calls.discard)
+
+    async def _call(self, handler: Handler, job: tuple[float, int, str, dict[str, Any]]) -> None:
+        try:
+            await handler(job[3])
+        except Exception:
+            logging.exception(f'Scheduled job failed: {job[2]} {job[3]}')
+        finally:
+            # the job is removed from storage only once its handler is done
+            if self._running.pop(job[1], None) is not None:
+                self.save()
+
+
+scheduler = Scheduler()
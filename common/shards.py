@@ -0,0 +1,50 @@
+from __future__ import annotations
+from typing import Any, Optional
+from collections import deque
+from discord import Guild
+import time
+
+
+def shard_of(args: tuple[Any, ...]) -> Optional[int]:
+    """shard of the guild an event belongs to"""
+    if not args:
+        return None
+
+    guild = args[0] if isinstance(args[0], Guild) else getattr(args[0], 'guild', None)
+    return getattr(guild, 'shard_id', None)
+
+
+class ShardEvents:
+    """dispatched events per shard, counted in one-second buckets"""
+
+    def __init__(self, window: int = 60) -> None:
+        self.window: int = window
+        self.totals: dict[int, int] = {}
+        self._buckets: dict[int, deque[list[int]]] = {}
+
+    def record(self, args: tuple[Any, ...]) -> None:
+        shard_id = shard_of(args)
+
+        if shard_id is None:
+            return
+
+        now = int(time.monotonic())
+        buckets = self._buckets.get(shard_id)
+
+        if buckets is None:
+            buckets = self._buckets[shard_id] = deque(maxlen = self.window)
+
+        if buckets and buckets[-1][0] == now:
+            buckets[-1][1] += 1
+        else:
+            buckets.append([now, 1])
+
+        self.totals[shard_id] = self.totals.get(shard_id, 0) + 1
+
+    def rate(self, shard_id: int) -> float:
+        """events per second over the last `window` seconds"""
+        since = int(time.monotonic()) - self.window
+        return sum(c for t, c in self._buckets.get(shard_id, ()) if t > since) / self.window
+
+
+shard_events = ShardEvents()
@@ -1,15 +1,27 @@
-from typing import Optional, Any
+from typing import Optional, Any, NamedTuple, Union
 from datetime import datetime
 from zoneinfo import ZoneInfo
+from enum import Enum
+import unicodedata
 import re
 
 _RE = re.compile(r'-?[0-9]+')
+_DIGITS = re.compile(r'[0-9]+')
+_NON_DIGIT = re.compile(r'\D')
+_MENTION = re.compile(r'<@!?([0-9]{17,19})>')
+_FC = re.compile(r'(?<![0-9])(?<![0-9][-./])([0-9]{4})[-. /]?([0-9]{4})[-. /]?([0-9]{4})(?![0-9])(?![-./][0-9])')
+_KANA = str.maketrans({chr(c): chr(c - 0x60) for c in range(0x30A1, 0x30F7)})
 
 def get(l: list[Any], i: int) -> Optional[Any]:
     if len(l) <= i: return None
     return l[i]
 
 
+def normalize(name: str) -> str:
+    """fold case, width, kana (katakana -> hiragana) and spaces"""
+    return ''.join(unicodedata.normalize('NFKC', name).casefold().translate(_KANA).split())
+
+
 def get_integers(text: str) -> list[int]:
     return list(map(int,_RE.findall(text)))
 
@@ -22,7 +34,7 @@ def get_dt(txt: str) -> datetime:
         datetime: JST datetime (aware)
     """
     now = datetime.now(ZoneInfo('Asia/Tokyo'))
-    nums = list(map(int,re.findall(r'[0-9]+',txt)))[:3][::-1]
+    nums = list(map(int,_DIGITS.findall(txt)))[:3][::-1]
     return datetime(
         year= get(nums,2) or now.year,
         month= get(nums,1) or now.month,
@@ -30,32 +42,76 @@ def get_dt(txt: str) -> datetime:
         tzinfo=ZoneInfo('Asia/Tokyo')
     )
 
+def to_fc(m: Optional[re.Match]) -> Optional[str]:
+    if m is None:
+        return None
+
+    return '-'.join(m.groups())
+
+
+def to_discord_id(digits: str) -> Optional[int]:
+    if len(digits) >= 17 and len(digits) <= 19:
+        return int(digits)
+
+    return None
+
+
 def get_fc(txt: str) -> Optional[str]:
-    d_txt = re.sub(r'\D','',txt)
+    return to_fc(_FC.fullmatch(txt.strip()))
 
-    if len(d_txt) != 12:
-        return None
 
-    return f'{d_txt[:4]}-{d_txt[4:8]}-{d_txt[8:]}'
+def get_fcs(txt: str) -> list[str]:
+    """every FC in the text as `0000-0000-0000`, in order"""
+    return [to_fc(m) for m in _FC.finditer(txt)]
 
 
 def get_discord_id(txt: str) -> Optional[int]:
-    d_txt = re.sub(r'\D','',txt)
+    return to_discord_id(_NON_DIGIT.sub('', txt))
 
-    if len(d_txt) >= 17 and len(d_txt) <=19:
-        return int(d_txt)
 
-    return None
+class KeyType(Enum):
+    FC = 'fc'
+    DISCORD_ID = 'discord_id'
+    MENTION = 'mention'
+    NAME = 'name'
 
 
-def maybe_param(txt: str) -> tuple[Optional[str], Optional[int], Optional[str]]:
-    d_id = get_discord_id(txt)
-    fc = get_fc(txt)
+class LookupKey(NamedTuple):
+    type: KeyType
+    value: Union[str, int]
+
+
+def classify(txt: str) -> LookupKey:
+    """what a player search input is
+    Returns:
+        LookupKey: MENTION and DISCORD_ID have an int value, FC a formatted FC, NAME the input
+    """
+    m = _MENTION.fullmatch(txt.strip())
+
+    if m is not None:
+        return LookupKey(KeyType.MENTION, int(m.group(1)))
+
+    digits = _NON_DIGIT.sub('', txt)
+    d_id = to_discord_id(digits)
 
     if d_id is not None:
-        return None, d_id, None
+        return LookupKey(KeyType.DISCORD_ID, d_id)
+
+    fc = get_fc(txt)
 
     if fc is not None:
-        return None, None, fc
+        return LookupKey(KeyType.FC, fc)
+
+    return LookupKey(KeyType.NAME, txt)
+
+
+def maybe_param(txt: str) -> tuple[Optional[str], Optional[int], Optional[str]]:
+    key = classify(txt)
+
+    if key.type in (KeyType.DISCORD_ID, KeyType.MENTION):
+        return None, key.value, None
+
+    if key.type == KeyType.FC:
+        return None, None, key.value
 
     return txt, None, None
\ No newline at end of file
@@ -1,3 +1,5 @@
 from .cog import *
 from .components import *
-from .errors import *
\ No newline at end of file
+from .errors import *
+from .roles import *
+from .lineup import *
\ No newline at end of file
@@ -6,11 +6,16 @@ from discord import (
     ApplicationContext,
     ApplicationCommandError,
     Option,
-    Member
+    Member,
+    Role,
+    Guild,
+    Message
 )
 from .errors import *
 from . import components
-from common import get_integers
+from .roles import role_index
+from .lineup import lineup_updater
+from common import get_integers, scheduler, metrics
 
 ContextLike = Union[ApplicationContext, commands.Context]
 T = TypeVar('T')
@@ -33,6 +38,8 @@ class HandsUp(commands.Cog, name='Match'):
         self.hide: bool = False
         self.description: str = 'Recruitment of Participants'
         self.description_localizations: dict[str, str] = {'ja':'挙手関連'}
+        scheduler.register('recruit_remind', self.remind_recruit)
+        scheduler.register('recruit_expire', self.expire_recruit)
 
     @staticmethod
     def to_hours(text: str) -> list[int]:
@@ -85,11 +92,13 @@ class HandsUp(commands.Cog, name='Match'):
         hours = HandsUp.to_hours(hours)
         flag: bool = action == 't'
         payload = await components.participate(ctx, action, [member], hours)
-        await ctx.respond(
+        await components.send_lineup(
+            ctx,
+            payload['info'],
+            payload['embed'],
             {'ja': f'{member.name}さんが{", ".join([str(h) for h in hours])}へ{"仮" if flag else ""}挙手しました。'}.get(
                 ctx.locale, f'{member.name} have {"tentatively " if flag else ""}joined {", ".join([str(h) for h in hours])}.'
-            ),
-            embed = payload['embed'],
+            )
         )
 
         if payload.get('call'):
@@ -124,12 +133,14 @@ class HandsUp(commands.Cog, name='Match'):
         await ctx.response.defer()
         hours = HandsUp.to_hours(hours)
         member = member or ctx.author
-        e = await components.drop(ctx, [member], hours)
-        await ctx.respond(
+        payload = await components.drop(ctx, [member], hours)
+        await components.send_lineup(
+            ctx,
+            payload['info'],
+            payload['embed'],
             {'ja': f'{member.name}さんが{", ".join([str(h) for h in hours])}の挙手を取り下げました。'}.get(
                 ctx.locale, f'{member.name} have dropped {", ".join([str(h) for h in hours])}.'
-            ),
-            embed = e
+            )
         )
         return
 
@@ -183,6 +194,27 @@ class HandsUp(commands.Cog, name='Match'):
         return
 
 
+    @slash_command(
+        name = 'timezone',
+        description = 'Set the timezone of recruiting hours',
+        description_localizations = {'ja': '募集時間のタイムゾーンを設定'}
+    )
+    async def match_timezone(
+        self,
+        ctx: ApplicationContext,
+        name: Option(
+            str,
+            name = 'timezone',
+            name_localizations = {'ja': 'タイムゾーン'},
+            description = 'IANA timezone name (e.g. Asia/Tokyo, Europe/London)',
+            description_localizations = {'ja': 'IANAのタイムゾーン名 (例: Asia/Tokyo, Europe/London)'}
+        )
+    ) -> None:
+        await ctx.response.defer()
+        tz = components.set_timezone(ctx.guild_id, name)
+        await ctx.respond({'ja': f'タイムゾーンを{tz.key}に設定しました。'}.get(ctx.locale, f'Set timezone to {tz.key}.'))
+
+
     @commands.command(
         name = 'can',
         aliases = ['c'],
@@ -202,9 +234,11 @@ class HandsUp(commands.Cog, name='Match'):
         hours = HandsUp.to_hours(hours)
         members = members or [ctx.author]
         payload = await components.participate(ctx, 'c', members, hours)
-        await ctx.send(
-            f'{",".join([m.name for m in members])}さんが{", ".join([str(h) for h in hours])}へ挙手しました。',
-            embed = payload['embed'],
+        await components.send_lineup(
+            ctx,
+            payload['info'],
+            payload['embed'],
+            f'{",".join([m.name for m in members])}さんが{", ".join([str(h) for h in hours])}へ挙手しました。'
         )
 
         if payload.get('call'):
@@ -231,9 +265,11 @@ class HandsUp(commands.Cog, name='Match'):
         hours = HandsUp.to_hours(hours)
         members = members or [ctx.author]
         payload = await components.participate(ctx, 't', members, hours)
-        await ctx.send(
-            f'{",".join([m.name for m in members])}さんが{", ".join([str(h) for h in hours])}へ仮挙手しました。',
-            embed = payload['embed'],
+        await components.send_lineup(
+            ctx,
+            payload['info'],
+            payload['embed'],
+            f'{",".join([m.name for m in members])}さんが{", ".join([str(h) for h in hours])}へ仮挙手しました。'
         )
 
 
@@ -255,10 +291,12 @@ class HandsUp(commands.Cog, name='Match'):
     ) -> None:
         hours = HandsUp.to_hours(hours)
         members = members or [ctx.author]
-        e = await components.drop(ctx, members, hours)
-        await ctx.send(
-            f'{",".join([m.name for m in members])}さんが{", ".join([str(h) for h in hours])}の挙手を取り下げました。',
-            embed = e,
+        payload = await components.drop(ctx, members, hours)
+        await components.send_lineup(
+            ctx,
+            payload['info'],
+            payload['embed'],
+            f'{",".join([m.name for m in members])}さんが{", ".join([str(h) for h in hours])}の挙手を取り下げました。'
         )
 
 
@@ -308,6 +346,61 @@ class HandsUp(commands.Cog, name='Match'):
 
 
 
+    @commands.command(
+        name = 'timezone',
+        aliases = ['tz'],
+        description = 'Set the timezone of recruiting hours',
+        brief = '募集時間のタイムゾーンを設定',
+        usage = '!timezone <IANA name>',
+        hidden = False
+    )
+    @is_allowed_channel()
+    async def timezone(self, ctx: commands.Context, name: str = '') -> None:
+        tz = components.set_timezone(ctx.guild.id, name)
+        await ctx.send(f'タイムゾーンを{tz.key}に設定しました。')
+
+
+    async def remind_recruit(self, payload: dict) -> None:
+        guild = self.bot.get_guild(payload['guild_id'])
+
+        if guild is not None:
+            await components.remind(guild, payload['hour'])
+
+
+    async def expire_recruit(self, payload: dict) -> None:
+        guild = self.bot.get_guild(payload['guild_id'])
+
+        if guild is not None:
+            await components.expire(guild)
+
+
+    @commands.Cog.listener('on_message')
+    @metrics.timed('listener count_lineup_messages')
+    async def count_lineup_messages(self, message: Message) -> None:
+        lineup_updater.on_message(message)
+
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role: Role) -> None:
+        role_index.add(role)
+
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: Role) -> None:
+        role_index.remove(role)
+
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before: Role, after: Role) -> None:
+        if before.name != after.name:
+            role_index.rename(before, after)
+
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: Guild) -> None:
+        role_index.forget(guild.id)
+
+
     async def cog_command_error(self, ctx: ContextLike, error: ApplicationCommandError) -> None:
         content: Optional[str] = None
 
@@ -320,6 +413,8 @@ class HandsUp(commands.Cog, name='Match'):
             content = {'ja': '募集できる時間は25個までです。'}.get(ctx.locale, 'The maximum number of times that can be set is 25.')
         elif isinstance(error, NotGathering):
             content = {'ja': '募集している時間はありません。'}.get(ctx.locale, 'There is no recruiting.')
+        elif isinstance(error, InvalidTimezone):
+            content = {'ja': 'タイムゾーンが見つかりません。'}.get(ctx.locale, 'Timezone not found.')
 
         if content is not None:
             await ctx.respond(content)
@@ -342,6 +437,8 @@ class HandsUp(commands.Cog, name='Match'):
             content = '募集できる時間は25個までです。\nThe maximum number of times that can be set is 25.'
         elif isinstance(error, NotGathering):
             content = '募集している時間はありません。\nThere is no recruiting.'
+        elif isinstance(error, InvalidTimezone):
+            content = 'タイムゾーンが見つかりません。\nTimezone not found.'
 
         if content is not None:
             await ctx.send(content, delete_after=10.0)
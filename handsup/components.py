@@ -4,14 +4,20 @@ from discord.ext.commands import Context
 from discord import (
     ApplicationContext,
     Embed,
-    Colour
+    Colour,
+    Interaction,
+    HTTPException
 )
-from discord.utils import get
-
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import asyncio
+import time
 
 from .errors import *
-from common.api import get_guild_info, MY_ID, post_guild_info
+from .roles import get_role, ensure_roles, delete_roles, update_member_roles
+from .lineup import lineup_updater
+from common.api import get_guild_info, MY_ID, post_guild_info, CONFIG
+from common.scheduler import scheduler
 
 ContextLike = Union[ApplicationContext, Context]
 
@@ -22,9 +28,13 @@ if TYPE_CHECKING:
         Role,
         Message,
         WebhookMessage,
+        PartialMessage,
         TextChannel
     )
-    MessageLike = Union[Message, WebhookMessage]
+    MessageLike = Union[Message, WebhookMessage, PartialMessage]
+
+RECRUIT_REMIND_BEFORE: int = CONFIG.get('recruit_remind_before', 10)
+RECRUIT_EXPIRE_AFTER: int = CONFIG.get('recruit_expire_after', 60)
 
 
 def verify(message: MessageLike) -> bool:
@@ -51,22 +61,92 @@ async def get_lineup(channel: TextChannel) -> Optional[MessageLike]:
     return None
 
 
+async def find_lineup(ctx: ContextLike, info: dict) -> Optional[MessageLike]:
+    """lineup message recorded in `info` (history is searched only if nothing is recorded)"""
+    if 'lineup' not in info:
+        return await get_lineup(ctx.channel)
+
+    return recorded_lineup(ctx.guild, info)
+
+
+def recorded_lineup(guild: Guild, info: dict) -> Optional[PartialMessage]:
+    try:
+        channel_id, message_id = info['lineup']
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    channel = guild.get_channel_or_thread(channel_id)
+
+    if channel is None:
+        return None
+
+    return channel.get_partial_message(message_id)
+
+
+async def delete_message(message: Optional[MessageLike]) -> None:
+    if message is None:
+        return
+
+    try:
+        await message.delete()
+    except HTTPException:
+        pass
+
+
+async def send_lineup(
+    ctx: ContextLike,
+    info: dict,
+    embed: Embed,
+    content: Optional[str] = None,
+    repost: bool = False
+) -> None:
+    """update the lineup
+
+    A recent lineup in the same channel is edited in place (debounced).
+    Otherwise the new lineup is sent, its ID is recorded in `info` and the previous one is deleted.
+    """
+    old = await find_lineup(ctx, info)
+
+    if (
+        not repost
+        and old is not None
+        and old.channel.id == ctx.channel.id
+        and lineup_updater.is_recent(old)
+    ):
+        post_guild_info(ctx.guild.id, info)
+
+        if isinstance(ctx, ApplicationContext):
+            await ctx.respond(content)
+            lineup_updater.schedule(old, embed)
+        else:
+            lineup_updater.schedule(old, embed, content)
+
+        return
+
+    try:
+        if isinstance(ctx, ApplicationContext):
+            msg = await ctx.respond(content, embed=embed)
+            if isinstance(msg, Interaction):
+                msg = await msg.original_response()
+        else:
+            msg = await ctx.send(content, embed=embed)
+        info['lineup'] = [msg.channel.id, msg.id]
+        lineup_updater.track(msg)
+    finally:
+        post_guild_info(ctx.guild.id, info)
+
+    lineup_updater.cancel(old)
+    await delete_message(old)
+    return
+
+
 async def set_hours(
     guild: Guild,
     hours: list[Union[str, int]],
     members: list[Member]
     ) -> None:
-    roles: list[Role] = []
-
-    for hour in hours:
-        role: Optional[Role] = get(guild.roles, name=str(hour))
-
-        if role is None:
-            role = await guild.create_role(name=str(hour), mentionable=True)
-
-        roles.append(role)
-
-    await asyncio.gather(*[asyncio.create_task(member.add_roles(*roles)) for member in members])
+    roles: list[Role] = await ensure_roles(guild, hours)
+    await asyncio.gather(*[update_member_roles(member, add=roles) for member in dict.fromkeys(members)])
 
 
 async def drop_hours(
@@ -74,29 +154,167 @@ async def drop_hours(
     hours: list[Union[str, int]],
     members: list[Member]
     ) -> None:
-    roles: list[Role] = []
+    roles: list[Role] = [r for r in (get_role(guild, hour) for hour in hours) if r is not None]
+    await asyncio.gather(*[update_member_roles(member, remove=roles) for member in dict.fromkeys(members)])
+
+
+async def clear_hours(
+    guild: Guild,
+    hours: list[Union[str, int]],
+) -> None:
+    await delete_roles(guild, hours)
+    return
+
+
+def get_timezone(info: dict) -> ZoneInfo:
+    try:
+        return ZoneInfo(info.get('timezone') or 'Asia/Tokyo')
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo('Asia/Tokyo')
+
+
+def set_timezone(guild_id: int, name: str) -> ZoneInfo:
+    """store the guild's timezone (an IANA name such as `Asia/Tokyo`) and reschedule recruited hours in it"""
+    try:
+        tz = ZoneInfo(name.strip())
+    except (ZoneInfoNotFoundError, ValueError):
+        raise InvalidTimezone
+
+    info = get_guild_info(guild_id)
+    info['timezone'] = tz.key
+    unschedule_hours(guild_id, info)
+    schedule_hours(guild_id, info, list(info['recruit']))
+    post_guild_info(guild_id, info)
+    return tz
+
+
+def hour_start(hour: Union[str, int], tz: ZoneInfo) -> datetime:
+    """next start of `hour` (24 and later mean the next day) that has not expired yet"""
+    now = datetime.now(tz)
+    start = datetime.combine(now.date(), datetime.min.time(), tzinfo=tz) + timedelta(hours=int(hour))
+
+    if start + timedelta(minutes=RECRUIT_EXPIRE_AFTER) <= now:
+        start += timedelta(days=1)
+
+    return start
+
+
+def schedule_hours(guild_id: int, info: dict, hours: list[str]) -> None:
+    """record when new hours expire and schedule their reminder and expiry"""
+    if not hours:
+        return
+
+    tz = get_timezone(info)
+    now = datetime.now(tz)
+    expires: dict[str, float] = info.setdefault('expires', {})
+    jobs = []
 
     for hour in hours:
-        role: Optional[Role] = get(guild.roles, name=str(hour))
+        start = hour_start(hour, tz)
+        end = start + timedelta(minutes=RECRUIT_EXPIRE_AFTER)
+        payload = {'guild_id': guild_id, 'hour': hour}
+        expires[hour] = end.timestamp()
 
-        if role is None:
-            continue
+        if start - timedelta(minutes=RECRUIT_REMIND_BEFORE) > now:
+            jobs.append((start - timedelta(minutes=RECRUIT_REMIND_BEFORE), 'recruit_remind', payload))
 
-        roles.append(role)
+        jobs.append((end, 'recruit_expire', payload))
 
-    await asyncio.gather(*[asyncio.create_task(member.remove_roles(*roles)) for member in members])
+    scheduler.add_many(jobs)
 
 
-async def clear_hours(
-    guild: Guild,
-    hours: list[Union[str, int]],
-) -> None:
+def backfill_hours(guild_id: int, info: dict) -> None:
+    """schedule hours recruited before their expiry was recorded"""
+    expires: dict[str, float] = info.get('expires', {})
+    schedule_hours(guild_id, info, [hour for hour in info['recruit'] if hour not in expires])
+
+
+def unschedule_hours(guild_id: int, info: dict, hours: Optional[list[str]] = None) -> None:
+    expires: dict[str, float] = info.get('expires', {})
+
+    if hours is None:
+        scheduler.cancel('recruit_remind', guild_id=guild_id)
+        scheduler.cancel('recruit_expire', guild_id=guild_id)
+        expires.clear()
+        return
+
     for hour in hours:
-        role: Optional[Role] = get(guild.roles, name=str(hour))
+        if expires.pop(hour, None) is not None:
+            scheduler.cancel(guild_id=guild_id, hour=hour)
 
-        if role is not None:
-            await role.delete()
-    return
+
+async def expire(guild: Guild) -> list[str]:
+    """drop every expired hour of the guild at once and delete their roles
+
+    The lineup is re-rendered without those hours, or archived if none are left.
+
+    Returns:
+        list[str]: expired hours
+    """
+    info = get_guild_info(guild.id)
+    expires: dict[str, float] = info.get('expires', {})
+    now = time.time()
+    hours = [hour for hour, end in expires.items() if end <= now]
+
+    if not hours:
+        return hours
+
+    msg = recorded_lineup(guild, info)
+
+    try:
+        e = create_lineup(info['recruit'])
+    except (NotGathering, HourNotAddable):
+        e = None
+
+    for hour in hours:
+        expires.pop(hour)
+        info['recruit'].pop(hour, None)
+
+    if info['recruit']:
+        try:
+            e = create_lineup(info['recruit'])
+        except HourNotAddable:
+            e = None
+    else:
+        info['lineup'] = None
+
+    post_guild_info(guild.id, info)
+    await delete_roles(guild, hours)
+
+    if msg is None or e is None:
+        return hours
+
+    if info['recruit']:
+        lineup_updater.schedule(msg, e)
+        return hours
+
+    lineup_updater.cancel(msg)
+    e.set_author(name='アーカイブ')
+    e.color = Colour.yellow()
+
+    try:
+        await msg.edit(embed=e)
+    except HTTPException:
+        pass
+
+    return hours
+
+
+async def remind(guild: Guild, hour: str) -> None:
+    """mention the members of a filled hour in the lineup channel"""
+    info = get_guild_info(guild.id)
+    recruit_hour = info['recruit'].get(hour)
+
+    if recruit_hour is None or len(recruit_hour['c']) < 6 or not info.get('lineup'):
+        return
+
+    channel = guild.get_channel_or_thread(info['lineup'][0])
+
+    if channel is None:
+        return
+
+    mentions = ', '.join([f'<@{id}>' for id in recruit_hour['c']])
+    await channel.send(f'**{hour}** まもなく開始です\n{mentions}')
 
 
 def create_lineup(recruit: dict[str, list[int]]) -> Embed:
@@ -134,23 +352,27 @@ async def participate(
     action: Literal['c', 't'],
     members: list[Member],
     hours: list[Union[int, str]]
-) -> dict[str, Union[str, Embed]]:
-    payload: dict[str, Union[str, Embed]] = {}
+) -> dict[str, Union[str, Embed, dict]]:
+    """update recruit and roles; the caller sends the lineup with `send_lineup`"""
+    payload: dict[str, Union[str, Embed, dict]] = {}
     x, y = 'c', 't'
 
     if action == 't':
         x, y = 't', 'c'
 
     info = get_guild_info(ctx.guild.id)
+    backfill_hours(ctx.guild.id, info)
     recruit = info['recruit'].copy()
     ids: list[int] = [m.id for m in members]
     filled_hours:list[str] = []
+    new_hours: list[str] = []
 
     for hour in sorted(map(str, hours), key=lambda x: int(x)):
         recruit_hour = recruit.get(hour)
 
         if recruit_hour is None:
             recruit[hour] = {x: ids.copy(), y: []}
+            new_hours.append(hour)
         else:
             recruit_hour[x] = list(set(recruit_hour[x])|set(ids))
             recruit_hour[y] = list(set(recruit_hour[y])-set(ids))
@@ -160,8 +382,9 @@ async def participate(
 
     info['recruit'] = recruit.copy()
     payload['embed'] = create_lineup(recruit)
+    payload['info'] = info
+    schedule_hours(ctx.guild.id, info, new_hours)
     await set_hours(ctx.guild, hours, members)
-    post_guild_info(ctx.guild.id, info)
 
     if filled_hours:
         call_ids: set[int] = set([])
@@ -172,11 +395,6 @@ async def participate(
         members = [ctx.guild.get_member(id) for id in list(call_ids) if ctx.guild.get_member(id) is not None]
         payload['call'] = f"**{', '.join(filled_hours)}**{', '.join([member.mention for member in members])}"
 
-    msg = await get_lineup(ctx.channel)
-
-    if msg is not None:
-        await msg.delete()
-
     return payload
 
 
@@ -184,9 +402,11 @@ async def drop(
     ctx: ContextLike,
     members: list[Member],
     hours: list[Union[int, str]]
-) -> Embed:
+) -> dict[str, Union[Embed, dict]]:
+    """update recruit and roles; the caller sends the lineup with `send_lineup`"""
     guild = ctx.guild
     info = get_guild_info(guild.id)
+    backfill_hours(guild.id, info)
     recruit = info['recruit']
     recruit_hours = recruit.keys()
     member_ids = [m.id for m in members]
@@ -199,47 +419,50 @@ async def drop(
         recruit[str(hour)]['c'] = [i for i in recruit[str(hour)]['c'].copy() if i not in member_ids]
         recruit[str(hour)]['t'] = [i for i in recruit[str(hour)]['t'].copy() if i not in member_ids]
 
-    post_guild_info(guild.id, info)
     await drop_hours(guild, hours, members)
-    msg = await get_lineup(ctx.channel)
-
-    if msg is not None:
-        await msg.delete()
 
-    return create_lineup(recruit)
+    try:
+        return {'embed': create_lineup(recruit), 'info': info}
+    except (NotGathering, HourNotAddable):
+        post_guild_info(guild.id, info)
+        raise
 
 
 
 async def clear(ctx: ContextLike) -> None:
     guild = ctx.guild
     info = get_guild_info(guild.id)
+    msg = await find_lineup(ctx, info)
+
+    try:
+        e = create_lineup(info['recruit'])
+    except (NotGathering, HourNotAddable):
+        e = None
+
     await clear_hours(guild, info['recruit'].keys())
+    unschedule_hours(guild.id, info)
     info['recruit'] = {}
+    info['lineup'] = None
     post_guild_info(guild.id, info)
-    msg = await get_lineup(ctx.channel)
 
-    if msg is not None:
-        e = msg.embeds[0].copy()
+    lineup_updater.cancel(msg)
+
+    if msg is not None and e is not None:
         e.set_author(name='アーカイブ')
         e.color = Colour.yellow()
-        await msg.edit(embed=e)
+
+        try:
+            await msg.edit(embed=e)
+        except HTTPException:
+            pass
 
     return
 
 
 async def now(ctx: ContextLike) -> None:
-    guild = ctx.guild
-    e = create_lineup(get_guild_info(guild.id)['recruit'])
-    msg = await get_lineup(ctx.channel)
-
-    if isinstance(ctx, ApplicationContext):
-        await ctx.respond(embed = e)
-    elif isinstance(ctx, Context):
-        await ctx.send(embed=e)
-
-    if msg is not None:
-        await msg.delete()
-
+    info = get_guild_info(ctx.guild.id)
+    backfill_hours(ctx.guild.id, info)
+    await send_lineup(ctx, info, create_lineup(info['recruit']), repost=True)
     return
 
 
@@ -254,6 +477,7 @@ async def out(ctx: ContextLike, hours: Union[int, str]) -> None:
         except KeyError:
             pass
 
+    unschedule_hours(ctx.guild.id, info, [str(h) for h in hours])
     await clear_hours(ctx.guild, hours)
     post_guild_info(ctx.guild.id, info)
     return
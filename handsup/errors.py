@@ -8,4 +8,7 @@ class HourNotAddable(ApplicationCommandError, MyError):
     pass
 
 class NotGathering(ApplicationCommandError, MyError):
+    pass
+
+class InvalidTimezone(ApplicationCommandError, MyError):
     pass
\ No newline at end of file
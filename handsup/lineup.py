@@ -0,0 +1,79 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Optional, Union
+from discord import HTTPException
+import asyncio
+
+if TYPE_CHECKING:
+    from discord import Embed, Message, PartialMessage, WebhookMessage
+    MessageLike = Union[Message, WebhookMessage, PartialMessage]
+
+
+class LineupUpdater:
+    """edits recent lineups in place, coalescing quick successive updates
+
+    A lineup counts as recent while fewer than `repost_after` messages have
+    been sent in its channel since it was posted.
+    """
+
+    def __init__(self, repost_after: int = 10, delay: float = 1.0) -> None:
+        self.repost_after: int = repost_after
+        self.delay: float = delay
+        self._counts: dict[int, tuple[int, int]] = {}
+        self._pending: dict[int, tuple[MessageLike, Embed, list[str]]] = {}
+        self._tasks: dict[int, asyncio.Task] = {}
+
+    def track(self, message: MessageLike) -> None:
+        self._counts[message.channel.id] = (message.id, 0)
+
+    def on_message(self, message: Message) -> None:
+        entry = self._counts.get(message.channel.id)
+
+        if entry is not None and entry[0] != message.id:
+            self._counts[message.channel.id] = (entry[0], entry[1] + 1)
+
+    def is_recent(self, message: MessageLike) -> bool:
+        entry = self._counts.get(message.channel.id)
+        return entry is not None and entry[0] == message.id and entry[1] < self.repost_after
+
+    def schedule(self, message: MessageLike, embed: Embed, content: Optional[str] = None) -> None:
+        pending = self._pending.get(message.id)
+        lines = pending[2] if pending is not None else []
+
+        if content:
+            lines = (lines + [content])[-5:]
+
+        self._pending[message.id] = (message, embed, lines)
+
+        if message.id not in self._tasks:
+            self._tasks[message.id] = asyncio.create_task(self._flush(message.id))
+
+    def cancel(self, message: Optional[MessageLike]) -> None:
+        if message is None:
+            return
+
+        self._pending.pop(message.id, None)
+        task = self._tasks.pop(message.id, None)
+
+        if task is not None:
+            task.cancel()
+
+    async def _flush(self, message_id: int) -> None:
+        """edit until nothing is pending, including updates scheduled during an edit"""
+        try:
+            while message_id in self._pending:
+                await asyncio.sleep(self.delay)
+                message, embed, lines = self._pending.pop(message_id)
+
+                try:
+                    if lines:
+                        await message.edit(content='\n'.join(lines), embed=embed)
+                    else:
+                        await message.edit(embed=embed)
+                except HTTPException:
+                    pass
+        finally:
+            if self._tasks.get(message_id) is asyncio.current_task():
+                self._tasks.pop(message_id)
+
+
+lineup_updater = LineupUpdater()
@@ -0,0 +1,176 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Optional, Union, Iterable
+import asyncio
+import time
+
+if TYPE_CHECKING:
+    from discord import Guild, Role, Member
+
+
+class Limiter:
+    """at most `concurrency` requests in flight and `rate` starts per `per` seconds"""
+
+    def __init__(self, concurrency: int = 5, rate: int = 5, per: float = 1.0) -> None:
+        self.rate: int = rate
+        self.per: float = per
+        self._semaphore: asyncio.Semaphore = asyncio.Semaphore(concurrency)
+        self._tokens: float = float(rate)
+        self._updated: float = time.monotonic()
+
+    async def __aenter__(self) -> Limiter:
+        await self._semaphore.acquire()
+
+        while True:
+            now = time.monotonic()
+            self._tokens = min(float(self.rate), self._tokens + (now - self._updated) * self.rate / self.per)
+            self._updated = now
+
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return self
+
+            await asyncio.sleep((1 - self._tokens) * self.per / self.rate)
+
+    async def __aexit__(self, *args) -> None:
+        self._semaphore.release()
+
+
+_limiters: dict[int, Limiter] = {}
+
+
+def get_limiter(guild_id: int) -> Limiter:
+    limiter = _limiters.get(guild_id)
+
+    if limiter is None:
+        limiter = _limiters[guild_id] = Limiter()
+
+    return limiter
+
+
+class RoleIndex:
+    """hour name -> role id per guild, kept current by role events"""
+
+    def __init__(self) -> None:
+        self._guilds: dict[int, dict[str, int]] = {}
+
+    def _names(self, guild: Guild) -> dict[str, int]:
+        names = self._guilds.get(guild.id)
+
+        if names is None:
+            names = self._guilds[guild.id] = {r.name: r.id for r in guild.roles if r.name.isdecimal()}
+
+        return names
+
+    def get(self, guild: Guild, name: str) -> Optional[Role]:
+        names = self._names(guild)
+        role_id = names.get(name)
+
+        if role_id is None:
+            return None
+
+        role = guild.get_role(role_id)
+
+        if role is None or role.name != name:
+            names.pop(name)
+            return None
+
+        return role
+
+    def add(self, role: Role) -> None:
+        if role.name.isdecimal() and role.guild.id in self._guilds:
+            self._guilds[role.guild.id].setdefault(role.name, role.id)
+
+    def remove(self, role: Role) -> None:
+        names = self._guilds.get(role.guild.id)
+
+        if names is not None and names.get(role.name) == role.id:
+            names.pop(role.name)
+
+    def rename(self, before: Role, after: Role) -> None:
+        self.remove(before)
+        self.add(after)
+
+    def forget(self, guild_id: int) -> None:
+        self._guilds.pop(guild_id, None)
+
+
+role_index = RoleIndex()
+
+
+def get_role(guild: Guild, hour: Union[str, int]) -> Optional[Role]:
+    return role_index.get(guild, str(hour))
+
+
+_creating: dict[tuple[int, str], asyncio.Task] = {}
+
+
+async def _create_role(guild: Guild, name: str) -> Role:
+    async with get_limiter(guild.id):
+        role = get_role(guild, name)
+
+        if role is None:
+            role = await guild.create_role(name=name, mentionable=True)
+            role_index.add(role)
+
+        return role
+
+
+def create_role(guild: Guild, name: str) -> asyncio.Task:
+    """shared task so concurrent commands don't create the same hour twice"""
+    key = (guild.id, name)
+    task = _creating.get(key)
+
+    if task is None:
+        task = _creating[key] = asyncio.create_task(_create_role(guild, name))
+        task.add_done_callback(lambda _: _creating.pop(key, None))
+
+    return task
+
+
+async def ensure_roles(guild: Guild, hours: Iterable[Union[str, int]]) -> list[Role]:
+    """get hour roles, creating the missing ones concurrently"""
+    names = list(dict.fromkeys(str(h) for h in hours))
+    roles = {name: get_role(guild, name) for name in names}
+    missing = [name for name, role in roles.items() if role is None]
+    roles.update(zip(missing, await asyncio.gather(*[create_role(guild, name) for name in missing])))
+    return [roles[name] for name in names]
+
+
+async def delete_roles(guild: Guild, hours: Iterable[Union[str, int]]) -> None:
+    roles = [r for r in (get_role(guild, h) for h in dict.fromkeys(str(h) for h in hours)) if r is not None]
+    limiter = get_limiter(guild.id)
+
+    async def delete(role: Role) -> None:
+        async with limiter:
+            await role.delete()
+            role_index.remove(role)
+
+    await asyncio.gather(*[delete(role) for role in roles])
+
+
+async def update_member_roles(
+    member: Member,
+    add: Iterable[Role] = (),
+    remove: Iterable[Role] = ()
+) -> bool:
+    """apply only the roles that change
+
+    Each role is added or removed atomically, so concurrent commands and
+    role changes made by others are never overwritten.
+    Returns:
+        bool: whether a request was sent
+    """
+    current = {r.id for r in member.roles}
+    to_add = [r for r in dict.fromkeys(add) if r.id not in current]
+    to_remove = [r for r in dict.fromkeys(remove) if r.id in current]
+
+    if not to_add and not to_remove:
+        return False
+
+    async with get_limiter(member.guild.id):
+        if to_add:
+            await member.add_roles(*to_add)
+        if to_remove:
+            await member.remove_roles(*to_remove)
+
+    return True
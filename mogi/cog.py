@@ -18,11 +18,16 @@ from .status import Status
 from common import (
     get_team_name,
     post_results,
+    post_races,
+    to_record,
+    result_key,
     Lang,
     Point,
     Race,
     Rank,
-    Track
+    Track,
+    ensure_chunked,
+    metrics
 )
 
 
@@ -48,13 +53,23 @@ class Mogi(commands.Cog, name='Mogi'):
     ) -> None:
         await ctx.response.defer()
         MogiMessage.verify(message, raise_exceptions=True)
+        await ensure_chunked(ctx.guild)
         msg = MogiMessage.convert(message)
-        post_results(
+        position = post_results(
             guild_id = ctx.guild_id,
             point = msg.total,
             enemy = msg.tags[-1],
             dt = msg.message.created_at
         )
+
+        if position is not None:
+            record = to_record(msg.total, msg.tags[-1], msg.message.created_at)
+            post_races(
+                guild_id = ctx.guild_id,
+                races = msg.races,
+                dt = msg.message.created_at,
+                key = result_key(record['score'], record['enemyScore'], record['enemy'], record['date'])
+            )
         txt = f'**{msg.tags[0]}**  `{msg.total}` **{msg.tags[1]}**'
         await ctx.respond({'ja': f'戦績を登録しました\n{txt}'}.get(msg.lang.value, f'Registered result\n{txt}'))
 
@@ -86,6 +101,7 @@ class Mogi(commands.Cog, name='Mogi'):
         await ctx.response.defer()
         members = set()
         if role is not None:
+            await ensure_chunked(ctx.guild)
             members = set(role.members)
         name = get_team_name(ctx.guild_id) or ctx.guild.name
         await MogiMessage(
@@ -148,10 +164,12 @@ class Mogi(commands.Cog, name='Mogi'):
             default = None
         )
     ) -> None:
+        await ctx.response.defer()
         msg, _ = await MogiMessage.get(ctx.channel)
         if enemy is not None:
             msg.tags[1] = enemy
         if role is not None:
+            await ensure_chunked(ctx.guild)
             msg.members = set(role.members)
         await msg.refresh()
         await ctx.respond({'ja':'即時を編集しました。'}.get(msg.lang.value, 'Edited mogi.'))
@@ -407,6 +425,7 @@ class Mogi(commands.Cog, name='Mogi'):
 
 
     @commands.Cog.listener('on_message')
+    @metrics.timed('listener on_mogi_message')
     async def on_mogi_message(self, message: Message):
 
         if message.author.bot:
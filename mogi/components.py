@@ -21,7 +21,8 @@ from common import (
     Rank,
     Track,
     BOT_IDS,
-    MY_ID
+    MY_ID,
+    ensure_chunked
 )
 
 from .status import Status
@@ -291,6 +292,7 @@ class MogiMessage:
                 if message.author.id != MY_ID:
                     continue
 
+                await ensure_chunked(message.guild)
                 msg = MogiMessage.convert(message)
                 if msg.status == Status.ARCHIVE:
                     if include_archive:
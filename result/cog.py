@@ -6,15 +6,16 @@ from discord import (
     ApplicationCommandError,
     SlashCommandGroup,
     File,
-    Attachment
+    Attachment,
+    OptionChoice
 )
 from discord.utils import format_dt
 
 from .errors import *
 from .components import ResultPaginator
 from . import components
-from common.plotting import result_graph as plot_result
 from common.api import get_team_name
+from common.lang import Lang
 
 
 
@@ -80,12 +81,56 @@ class Result(commands.Cog, name = 'Result'):
         description = 'Show result graph',
         description_localizations = {'ja': '戦績グラフを表示'}
     )
-    async def result_graph(self, ctx: ApplicationContext) -> None:
+    async def result_graph(
+        self,
+        ctx: ApplicationContext,
+        days: Option(
+            int,
+            name = 'period',
+            name_localizations = {'ja': '期間'},
+            description = 'Period to show',
+            description_localizations = {'ja': '表示する期間'},
+            choices = [
+                OptionChoice(name = 'All', value = 0, name_localizations = {'ja': '全期間'}),
+                OptionChoice(name = 'Last 30 days', value = 30, name_localizations = {'ja': '直近30日'}),
+                OptionChoice(name = 'Last 90 days', value = 90, name_localizations = {'ja': '直近90日'}),
+                OptionChoice(name = 'Last 365 days', value = 365, name_localizations = {'ja': '直近1年'})
+            ],
+            default = 0
+        )
+    ) -> None:
         await ctx.response.defer()
-        buffer = plot_result(components.get(ctx.guild_id))
+        buffer = await components.graph(ctx.guild_id, days)
         await ctx.respond(file = File(buffer, 'results.png'))
 
 
+    @result.command(
+        name = 'track',
+        description = 'Show results per track',
+        description_localizations = {'ja': 'コース別の戦績を表示'}
+    )
+    async def result_track(
+        self,
+        ctx: ApplicationContext,
+        sort_by: Option(
+            str,
+            name = 'sort',
+            name_localizations = {'ja': '並び順'},
+            description = 'Sort key',
+            description_localizations = {'ja': '並び替えの基準'},
+            choices = [
+                OptionChoice(name = 'Diff', value = 'diff', name_localizations = {'ja': '平均点差'}),
+                OptionChoice(name = 'Pick', value = 'count', name_localizations = {'ja': '選択回数'}),
+                OptionChoice(name = 'Win rate', value = 'rate', name_localizations = {'ja': '勝率'})
+            ],
+            default = 'diff'
+        )
+    ) -> None:
+        await ctx.response.defer()
+        lang = {'ja': Lang.JA}.get(ctx.locale, Lang.EN)
+        await components.track_stats(ctx.guild_id, sort_by, lang).respond(ctx.interaction)
+
+
     @result.command(
         name = 'register',
         description = 'Register result',
@@ -258,8 +303,12 @@ class Result(commands.Cog, name = 'Result'):
             content = {'ja':'存在しないIDが含まれています。'}.get(ctx.locale, 'This ID does not exist.')
         elif isinstance(error, NotCSVFile):
             content = {'ja':'CSVファイルのみが有効です。'}.get(ctx.locale, 'Only CSV file is available.')
+        elif isinstance(error, InvalidRows) and error.errors:
+            content = {'ja':'ファイルの内容が不正です。\n'}.get(ctx.locale, 'Not acceptable content.\n') + f'```{error}```'
         elif isinstance(error, NotAcceptableContent):
             content = {'ja':'ファイルの内容が不正です。'}.get(ctx.locale, 'Not acceptable content.')
+        elif isinstance(error, GraphNotAvailable):
+            content = {'ja':'グラフを作成できませんでした。時間をおいて再度お試しください。'}.get(ctx.locale, 'Could not draw the graph. Please try again later.')
 
         if content is not None:
             await ctx.respond(content, ephemeral = True)
@@ -1,20 +1,40 @@
 from __future__ import annotations
-from typing import TYPE_CHECKING, Union, Optional, Any
+from typing import TYPE_CHECKING, Union, Optional, Any, IO
 from discord.ext import commands, pages
-from io import BytesIO
+from io import BytesIO, TextIOWrapper
+from collections import OrderedDict
+from tempfile import TemporaryFile
 import pandas as pd
+import aiohttp
+import asyncio
+import logging
+import csv
 
-from datetime import datetime
+from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 
 from .errors import *
+from .index import EnemyIndex
+from common.plotting import graph_renderer, graph_cache, RendererBusy
 from common import (
+    Lang,
     Point,
+    Track,
+    get_races,
     get_results,
+    get_summary,
+    post_summary,
+    summarize,
+    update_summary,
     get_dt,
     get_integers,
     post_results,
-    post_data
+    post_data,
+    post_result_rows,
+    result_revision,
+    rebuild_summary,
+    result_key,
+    rekey_races
 )
 
 if TYPE_CHECKING:
@@ -29,33 +49,100 @@ def WinOrLose(diff: int) -> str:
     return 'Win'
 
 
-def get(guild_id: int) -> pd.DataFrame:
+def to_frame(results: list[dict]) -> pd.DataFrame:
+    df = pd.DataFrame(results)
+    df['date'] = pd.to_datetime(df['date'], infer_datetime_format = True)
+    return df.sort_values(
+        by = 'date',
+        ascending = True,
+        inplace = False,
+        kind = 'mergesort'
+    )
+
+
+MAX_FRAMES: int = 32
+_frames: OrderedDict[int, tuple[str, pd.DataFrame, EnemyIndex]] = OrderedDict()
+
+
+def _keep_frame(guild_id: int, revision: str, df: pd.DataFrame) -> tuple[pd.DataFrame, EnemyIndex]:
+    index = EnemyIndex.build(df['enemy'].tolist())
+    _frames[guild_id] = (revision, df, index)
+    _frames.move_to_end(guild_id)
+
+    while len(_frames) > MAX_FRAMES:
+        _frames.popitem(last = False)
+
+    return df, index
+
+
+def load(guild_id: int, summary: Optional[dict] = None) -> tuple[pd.DataFrame, EnemyIndex]:
+    """results sorted by date and their enemy index (do not modify them)
+
+    Both are kept for recently used guilds while the revision in summary.json
+    is unchanged, so repeated lookups read summary.json only. A summary that
+    was not written with these results is rebuilt from them.
+
+    Raises:
+        EmptyResult: no results are registered
+    """
+    if summary is None:
+        summary = get_summary(guild_id)
+
+    revision = summary.get('revision')
+    entry = _frames.get(guild_id)
+
+    if entry is not None and revision is not None and entry[0] == revision:
+        _frames.move_to_end(guild_id)
+        return entry[1], entry[2]
+
+    _frames.pop(guild_id, None)
     results = get_results(guild_id)
 
-    if results:
-        df = pd.DataFrame(results)
-        df = df.copy()
-        df['date'] = pd.to_datetime(df['date'], infer_datetime_format = True)
-        return df.sort_values(
-            by = 'date',
-            ascending = True,
-            inplace = False
-        )
+    if not results:
+        raise EmptyResult
 
-    raise EmptyResult
+    if revision is None or revision != result_revision(results):
+        revision = rebuild_summary(guild_id, results)['revision']
 
+    return _keep_frame(guild_id, revision, to_frame(results))
 
-def post_df(guild_id, df: pd.DataFrame) -> None:
-    df.sort_values(by = 'date', ascending = True, inplace = True)
+
+def get(guild_id: int) -> pd.DataFrame:
+    """a copy of the results sorted by date, free to modify
+    Raises:
+        EmptyResult: no results are registered
+    """
+    return load(guild_id)[0].copy()
+
+
+def post_df(guild_id, df: pd.DataFrame, summary: dict) -> None:
+    """write the results together with their summary"""
+    df.sort_values(by = 'date', ascending = True, inplace = True, kind = 'mergesort')
     df = df.copy()
     df['date'] = df['date'].astype(str)
-    post_data(
-        path = f'{guild_id}/results.json',
-        params = df.drop_duplicates().to_dict('records')
-    )
+    records = df.drop_duplicates().to_dict('records')
+    revision = post_result_rows(guild_id, records, summary)
+    _frames.pop(guild_id, None)
+
+    if records:
+        _keep_frame(guild_id, revision, to_frame(records))
+
     return
 
 
+def result_keys(df: pd.DataFrame) -> list[str]:
+    """`result_key` of every row (the races of a result are stored under it)"""
+    return [
+        result_key(score, enemy_score, enemy, date)
+        for score, enemy_score, enemy, date in zip(
+            df['score'],
+            df['enemyScore'],
+            df['enemy'],
+            pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d %H:%M:%S')
+        )
+    ]
+
+
 class ResultPaginator(pages.Paginator):
 
     def __init__(
@@ -82,6 +169,13 @@ class ResultPaginator(pages.Paginator):
 
 
 
+def summary_footer(df: pd.DataFrame) -> str:
+    """win, lose and draw counts of the listed results"""
+    diff = df['score'] - df['enemyScore']
+    win, lose, draw = int((diff > 0).sum()), int((diff < 0).sum()), int((diff == 0).sum())
+    return f'__**Win**__:  {win}  __**Lose**__:  {lose}  __**Draw**__:  {draw}  [{win+lose+draw}]'
+
+
 def show_all(guild_id: int) -> ResultPaginator:
     df = get(guild_id)
     df['formatted_scores'] = df['score'].astype(str) + ' - ' + df['enemyScore'].astype(str)
@@ -92,23 +186,21 @@ def show_all(guild_id: int) -> ResultPaginator:
         header = ['Scores', 'Enemy', 'Result'],
         justify = 'center'
     ).split('\n')
-    win, lose, draw = len(df[df['diff']>0]), len(df[df['diff']<0]), len(df[df['diff']==0])
     return ResultPaginator(
         body = lines[1:],
         header = lines[0],
-        footer = f'__**Win**__:  {win}  __**Lose**__:  {lose}  __**Draw**__:  {draw}  [{len(df)}]'
+        footer = summary_footer(df)
     )
 
 
 def search_results(guild_id:int, name: str) -> Union[ResultPaginator, list[str]]:
-    d = get(guild_id)
-    df = d.query(f'enemy=="{name}"').copy()
+    d, index = load(guild_id)
+    rows = index.lookup(name)
 
-    if len(df) == 0:
-        name_list: list[str] = d['enemy'].unique().tolist()
-        prefix = name[0].lower()
-        return [n for n in name_list if n[0].lower() == prefix]
+    if not rows:
+        return index.suggest(name)
 
+    df = d.iloc[rows].copy()
     df['formatted_scores'] = df['score'].astype(str) + ' - ' + df['enemyScore'].astype(str)
     df['diff'] = df['score'] - df['enemyScore']
     df['date']=df['date'].dt.strftime('%Y/%m/%d').copy()
@@ -118,12 +210,106 @@ def search_results(guild_id:int, name: str) -> Union[ResultPaginator, list[str]]
         header = ['Date', 'Scores', 'Result'],
         justify = 'center'
     ).split('\n')
-    win, lose, draw = len(df[df['diff']>0]), len(df[df['diff']<0]), len(df[df['diff']==0])
+    names = df['enemy'].unique().tolist()
+    return ResultPaginator(
+        top = f'vs **{", ".join(names)}**',
+        body = lines[1:],
+        header = lines[0],
+        footer = summary_footer(df)
+    )
+
+
+async def graph(guild_id: int, days: int = 0) -> BytesIO:
+    """
+    Args:
+        days (int): plot only the last `days` days (0: all)
+    """
+    key = f'{guild_id}-{days}'
+    summary = get_summary(guild_id)
+    revision = summary.get('revision')
+
+    if not days and revision is not None:
+        data = graph_cache.get(key, revision)
+
+        if data is not None:
+            return BytesIO(data)
+
+    df, _ = load(guild_id, summary)
+    title = 'Win&Lose History'
+
+    if days:
+        since = datetime.now(tz=ZoneInfo(key='Asia/Tokyo')).replace(tzinfo=None) - timedelta(days=days)
+        df = df[df['date'] >= since]
+        title += f' (last {days} days)'
+
+        if len(df) == 0:
+            raise EmptyResult
+
+    digest = graph_cache.digest(df)
+    data = graph_cache.lookup(key, revision, digest)
+
+    if data is None:
+        try:
+            data = (await graph_renderer.render(df, title)).getvalue()
+        except (RendererBusy, asyncio.TimeoutError):
+            raise GraphNotAvailable
+
+        graph_cache.put(key, revision, digest, data)
+
+    return BytesIO(data)
+
+
+def aggregate_races(data: dict[str, list]) -> dict[str, list[int]]:
+    df = pd.DataFrame({'track': data['track'], 'diff': data['diff']})
+    df = df[df['track'] != '']
+    agg = df.assign(win = df['diff'] > 0).groupby('track').agg(
+        count = ('diff', 'size'),
+        total = ('diff', 'sum'),
+        win = ('win', 'sum')
+    )
+    return {t: [int(c), int(d), int(w)] for t, (c, d, w) in zip(agg.index, agg.to_numpy())}
+
+
+def track_stats(guild_id: int, sort_by: str = 'diff', lang: Lang = Lang.JA) -> ResultPaginator:
+    data = get_races(guild_id)
+    stats = data.get('stats')
+
+    if stats is None:
+        stats = aggregate_races(data)
+
+    unknown = [t for t in stats if t not in Track.__members__]
+
+    if unknown:
+        logging.warning(f'Unknown tracks left out of stats: {unknown} (guild {guild_id})')
+        stats = {t: s for t, s in stats.items() if t in Track.__members__}
+
+    if not stats:
+        raise EmptyResult
+
+    df = pd.DataFrame.from_dict(stats, orient = 'index', columns = ['count', 'total', 'win'])
+    df['diff'] = df['total'] / df['count']
+    df['rate'] = df['win'] / df['count'] * 100
+    df['pick'] = df['count'] / df['count'].sum() * 100
+    df.sort_values(
+        by = [sort_by] if sort_by == 'count' else [sort_by, 'count'],
+        ascending = False,
+        inplace = True
+    )
+    df.index = [Track[t].nick_ja if lang == Lang.JA else Track[t].nick_en for t in df.index]
+    lines = df.to_string(
+        columns = ['count', 'pick', 'diff', 'rate'],
+        formatters = {
+            'pick': '{:.1f}%'.format,
+            'diff': '{:+.1f}'.format,
+            'rate': '{:.0f}%'.format
+        },
+        header = ['Races', 'Pick', 'Diff', 'Win'],
+        justify = 'center'
+    ).split('\n')
     return ResultPaginator(
-        top = f'vs **{name}**',
         body = lines[1:],
         header = lines[0],
-        footer = f'__**Win**__:  {win}  __**Lose**__:  {lose}  __**Draw**__:  {draw}  [{len(df)}]'
+        footer = f'[{df["count"].sum()}]'
     )
 
 
@@ -156,7 +342,7 @@ def register(
 
 def delete(guild_id: int, ids: str, locale: str = 'ja') -> ResultPaginator:
     df = get(guild_id)
-    ids: list[int] = sorted(get_integers(ids))
+    ids: list[int] = sorted(set(get_integers(ids)))
 
     if not ids:
         raise InvalidIdInput
@@ -166,6 +352,12 @@ def delete(guild_id: int, ids: str, locale: str = 'ja') -> ResultPaginator:
     except IndexError:
         raise IdOutOfRange
 
+    summary = get_summary(guild_id)
+    keys = result_keys(dropped)
+
+    for score, enemy_score, enemy in zip(dropped['score'], dropped['enemyScore'], dropped['enemy']):
+        update_summary(summary, score, enemy_score, enemy, -1)
+
     dropped['formatted_scores'] = dropped['score'].astype(str) + ' - ' + dropped['enemyScore'].astype(str)
     dropped['date'] = dropped['date'].dt.strftime('%Y/%m/%d').copy()
     df.drop(
@@ -174,7 +366,8 @@ def delete(guild_id: int, ids: str, locale: str = 'ja') -> ResultPaginator:
         inplace = True
     )
 
-    post_df(guild_id, df)
+    post_df(guild_id, df, summary)
+    rekey_races(guild_id, dict.fromkeys(keys))
     lines = dropped.to_string(
         columns = ['enemy', 'formatted_scores', 'date'],
         header = ['Enemy', 'Scores', 'Date'],
@@ -221,45 +414,138 @@ def edit(
     if date is not None:
         data['date'] = get_dt(date).replace(tzinfo=None)
 
+    summary = get_summary(guild_id)
+    update_summary(
+        summary,
+        df.at[result_id, 'score'],
+        df.at[result_id, 'enemyScore'],
+        df.at[result_id, 'enemy'],
+        -1
+    )
+    update_summary(summary, data['score'], data['enemyScore'], data['enemy'])
+    old_key = result_keys(df.loc[[result_id]])[0]
     df.loc[result_id] = data
-    post_df(guild_id, df)
+    new_key = result_keys(df.loc[[result_id]])[0]
+    post_df(guild_id, df, summary)
+
+    if new_key != old_key:
+        rekey_races(guild_id, {old_key: new_key})
+
     return {'enemy': data['enemy'], 'point': Point(data['score'], data['enemyScore']), 'dt': data['date']}
 
 
-def export_file(guild_id: int, name: str) -> BytesIO:
-    data = get_results(guild_id)
+def export_file(guild_id: int, name: str) -> IO[bytes]:
+    data = get_results(guild_id, create = False)
 
     if not data:
         raise EmptyResult
 
-    df = pd.DataFrame(data)
-    df.insert(0, 'team', name)
-    buffer = BytesIO()
-    df.to_csv(
-        buffer,
-        encoding = 'utf-8',
-        header = False,
-        index = False,
-        columns = ['team','score','enemyScore','enemy','date']
-    )
+    buffer = TemporaryFile()
+    text = TextIOWrapper(buffer, encoding = 'utf-8', newline = '')
+    writer = csv.writer(text, lineterminator = '\n')
+
+    for r in data:
+        writer.writerow((name, r['score'], r['enemyScore'], r['enemy'], r['date']))
+
+    text.flush()
+    text.detach()
     buffer.seek(0)
     return buffer
 
 
-async def load_file(guild_id: int, file: Attachment) -> None:
-    buffer = BytesIO()
-    await file.save(buffer)
+def _parse_chunk(
+    lines: list[int],
+    columns: tuple[list[str], ...],
+    errors: list[tuple[int, str]]
+) -> pd.DataFrame:
+    numbers = pd.Series(lines, dtype = 'int64')
+    score = pd.to_numeric(pd.Series(columns[0], dtype = object), errors = 'coerce')
+    enemy_score = pd.to_numeric(pd.Series(columns[1], dtype = object), errors = 'coerce')
+    enemy = pd.Series(columns[2], dtype = object)
+    date = pd.to_datetime(pd.Series(columns[3], dtype = object), errors = 'coerce', infer_datetime_format = True)
 
-    try:
-        df = pd.read_csv(
-            buffer,
-            skipinitialspace = True,
-            header = None
-        ).loc[:,[1,2,3,4]]
-        df.columns = ['score','enemyScore','enemy','date']
-        df = df.copy()
-        df['date'] = pd.to_datetime(df['date'], infer_datetime_format = True)
-        df.sort_values(by = 'date', ascending = True, inplace = False)
-        post_df(guild_id, df)
-    except Exception:
-        raise NotAcceptableContent
+    for mask, reason in (
+        (score.isna() | (score % 1 != 0), 'invalid score'),
+        (enemy_score.isna() | (enemy_score % 1 != 0), 'invalid enemy score'),
+        (enemy.str.strip().eq(''), 'empty enemy'),
+        (date.isna(), 'invalid date')
+    ):
+        errors += [(int(n), reason) for n in numbers[mask]]
+
+    if errors:
+        return pd.DataFrame()
+
+    return pd.DataFrame({
+        'score': score.astype('int64'),
+        'enemyScore': enemy_score.astype('int64'),
+        'enemy': enemy,
+        'date': date
+    })
+
+
+def parse_rows(text: IO[str], chunksize: int = 10000) -> pd.DataFrame:
+    """read `team,score,enemyScore,enemy,date` rows from a stream
+
+    Rows are validated `chunksize` at a time and only the typed columns of
+    each chunk are kept, so the raw text is never held as a whole.
+
+    Raises:
+        InvalidRows: with line numbers of rows that cannot be read
+    """
+    errors: list[tuple[int, str]] = []
+    frames: list[pd.DataFrame] = []
+    lines: list[int] = []
+    columns: tuple[list[str], ...] = ([], [], [], [])
+    reader = csv.reader(text, skipinitialspace = True)
+
+    for row in reader:
+
+        if not any(v.strip() for v in row):
+            continue
+
+        if len(row) != 5:
+            errors.append((reader.line_num, f'expected 5 columns, got {len(row)}'))
+            continue
+
+        for column, value in zip(columns, row[1:]):
+            column.append(value)
+
+        lines.append(reader.line_num)
+
+        if len(lines) >= chunksize:
+            frames.append(_parse_chunk(lines, columns, errors))
+            lines, columns = [], ([], [], [], [])
+
+    if lines:
+        frames.append(_parse_chunk(lines, columns, errors))
+
+    if errors or not frames:
+        raise InvalidRows(sorted(errors))
+
+    return pd.concat(frames, ignore_index = True)
+
+
+async def load_file(guild_id: int, file: Attachment) -> None:
+    with TemporaryFile() as buffer:
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(file.url) as response:
+                    if response.status != 200:
+                        raise NotAcceptableContent
+                    async for chunk in response.content.iter_chunked(64 * 1024):
+                        buffer.write(chunk)
+        except aiohttp.ClientError:
+            raise NotAcceptableContent
+
+        buffer.seek(0)
+        text = TextIOWrapper(buffer, encoding = 'utf-8-sig', newline = '')
+
+        try:
+            df = parse_rows(text)
+        except (UnicodeDecodeError, csv.Error):
+            raise NotAcceptableContent
+        finally:
+            text.detach()
+
+    post_df(guild_id, df, summarize(df.drop_duplicates().to_dict('records')))
+    rekey_races(guild_id, keep = set(result_keys(df)))
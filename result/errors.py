@@ -16,4 +16,13 @@ class NotCSVFile(ApplicationCommandError, Exception):
     pass
 
 class NotAcceptableContent(ApplicationCommandError, Exception):
+    pass
+
+class InvalidRows(NotAcceptableContent):
+
+    def __init__(self, errors: list[tuple[int, str]]) -> None:
+        self.errors: list[tuple[int, str]] = errors
+        super().__init__('\n'.join(f'line {n}: {reason}' for n, reason in errors[:10]))
+
+class GraphNotAvailable(ApplicationCommandError, Exception):
     pass
\ No newline at end of file
@@ -0,0 +1,96 @@
+from __future__ import annotations
+from typing import Iterable
+
+from common.utils import normalize
+
+
+def ngrams(key: str) -> set[str]:
+    padded = f'^{key}$'
+    return {padded[i:i+2] for i in range(len(padded)-1)}
+
+
+def distance(a: str, b: str) -> int:
+    """Levenshtein distance"""
+    if len(a) < len(b):
+        a, b = b, a
+
+    prev = list(range(len(b)+1))
+
+    for i, x in enumerate(a, 1):
+        cur = [i]
+
+        for j, y in enumerate(b, 1):
+            cur.append(min(prev[j]+1, cur[j-1]+1, prev[j-1]+(x != y)))
+
+        prev = cur
+
+    return prev[-1]
+
+
+class EnemyIndex:
+    """normalized enemy name -> row positions of the date-sorted results"""
+
+    __slots__ = (
+        'rows',
+        'names',
+        'grams'
+    )
+
+    def __init__(self) -> None:
+        self.rows: dict[str, list[int]] = {}
+        self.names: dict[str, str] = {}
+        self.grams: dict[str, set[str]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(r) for r in self.rows.values())
+
+    @classmethod
+    def build(cls, enemies: Iterable[str]) -> EnemyIndex:
+        index = cls()
+        keys: dict[str, str] = {}
+
+        for pos, name in enumerate(enemies):
+            key = keys.get(name)
+
+            if key is None:
+                key = keys[name] = normalize(name)
+
+            index._add(key, name, pos)
+
+        return index
+
+    def _add(self, key: str, name: str, pos: int) -> None:
+        rows = self.rows.get(key)
+
+        if rows is None:
+            self.rows[key] = [pos]
+
+            for gram in ngrams(key):
+                self.grams.setdefault(gram, set()).add(key)
+        else:
+            rows.append(pos)
+
+        self.names[key] = name
+
+    def lookup(self, name: str) -> list[int]:
+        return self.rows.get(normalize(name), [])
+
+    def suggest(self, name: str, limit: int = 5) -> list[str]:
+        key = normalize(name)
+        grams = ngrams(key)
+        shared: dict[str, int] = {}
+
+        for gram in grams:
+            for candidate in self.grams.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+
+        threshold = max(1, len(key) // 2)
+        scored: list[tuple[int, int, str]] = []
+
+        for candidate, count in shared.items():
+            d = distance(key, candidate)
+            if d <= threshold or candidate.startswith(key) or key in candidate:
+                scored.append((d, -count, candidate))
+
+        return [self.names[c] for _, _, c in sorted(scored)[:limit]]
+
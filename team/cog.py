@@ -10,10 +10,9 @@ from discord import (
     Embed
 )
 import discord
-import pandas as pd
 from datetime import timedelta
 
-from .errors import PlayerNotFound
+from .errors import PlayerNotFound, MessageNotFound, RoleNotFound, AuthorNotFound
 from .components import VoteMessage
 
 from common import (
@@ -22,7 +21,15 @@ from common import (
     get_team_name,
     set_team_name,
     get_dt,
-    mkmg
+    mkmg,
+    scheduler,
+    Player,
+    to_players,
+    unique_players,
+    sort_by_mmr,
+    average_mmr,
+    ensure_chunked,
+    Lang
 )
 
 
@@ -38,20 +45,67 @@ class Lounge(commands.Cog, name='Team'):
         self.hide: bool = False
         self.description: str = 'Manage team info'
         self.description_localizations: dict[str, str] = {'ja':'チーム関連'}
+        scheduler.register('vote_remind', self.remind_vote)
+        scheduler.register('vote_close', self.close_vote)
 
     team = SlashCommandGroup(name='team')
     name = team.create_subgroup(name='name')
 
 
+    async def fetch_vote(self, payload: dict) -> Optional[VoteMessage]:
+        channel = self.bot.get_channel(payload['channel_id'])
+
+        if channel is None:
+            return None
+
+        try:
+            message = await channel.fetch_message(payload['message_id'])
+        except discord.NotFound:
+            scheduler.cancel(message_id = payload['message_id'])
+            return None
+
+        if not message.components:
+            return None
+
+        await ensure_chunked(message.guild)
+
+        try:
+            return VoteMessage.convert(message)
+        except (MessageNotFound, RoleNotFound, AuthorNotFound):
+            return None
+
+
+    async def remind_vote(self, payload: dict) -> None:
+        vote = await self.fetch_vote(payload)
+
+        if vote is None or not vote.unanswered:
+            return
+
+        await vote.message.reply(', '.join([m.mention for m in vote.unanswered]))
+
+
+    async def close_vote(self, payload: dict) -> None:
+        vote = await self.fetch_vote(payload)
+
+        if vote is None:
+            return
+
+        await vote.message.edit(
+            content = '投票を終了しました。' if vote.lang == Lang.JA else 'Finished.',
+            view = None
+        )
+
+
     @staticmethod
-    async def get_players(role: Role) -> list[dict]:
+    async def get_players(role: Role) -> list[Player]:
+        await ensure_chunked(role.guild)
         players = await get_players(
             discord_ids = [m.id for m in role.members],
             remove_None = True
         )
         if len(players) == 0:
             raise PlayerNotFound
-        return pd.DataFrame(players).drop_duplicates(subset='name').to_dict('records')
+        return unique_players(to_players(players))
 
 
     @discord.slash_command(
@@ -117,22 +171,26 @@ class Lounge(commands.Cog, name='Team'):
             )
     ) -> None:
         await ctx.response.defer()
-        players = [p for p in await Lounge.get_players(role) if p.get('mmr') is not None]
+        players = [p for p in await Lounge.get_players(role) if p.mmr is not None]
 
         if not players:
             raise PlayerNotFound
 
-        df = pd.DataFrame(players).sort_values('mmr', ascending=False)
-        average = df['mmr'].mean()
-        e = LoungeEmbed(mmr = average, title = f'Team MMR: {average:.1f}')
+        average = average_mmr(players)
+        e = LoungeEmbed.create(mmr = average, title = f'Team MMR: {average:.1f}')
         txt = f'**Role**  {role.mention}\n\n'
 
-        for i, player in enumerate(df.to_dict('records')):
-            txt += f'{str(i+1).rjust(3)}: [{player["name"]}]({LOUNGE_WEB+str(player["id"])}) (MMR: {player["mmr"]})\n'
+        for i, player in enumerate(sort_by_mmr(players)):
+            txt += f'{str(i+1).rjust(3)}: [{player.name}]({LOUNGE_WEB+str(player.id)}) (MMR: {player.mmr})\n'
 
         txt += f'\n**Rank**  {e.rank}'
         e.description = txt
-        await ctx.respond(embed = e)
+        file = e.file
+
+        if file is None:
+            await ctx.respond(embed = e)
+        else:
+            await ctx.respond(embed = e, file = file)
 
 
     @team.command(
@@ -155,8 +213,8 @@ class Lounge(commands.Cog, name='Team'):
         txt = f'**Role**  {role.mention}\n\n'
 
         for player in players:
-            fc = player.get("switchFc")
-            txt += f'[{player["name"]}]({MKC_URL}{player["registryId"]}) {"("+fc+")" if fc is not None else ""}\n'
+            fc = player.switch_fc
+            txt += f'[{player.name}]({MKC_URL}{player.registry_id}) {"("+fc+")" if fc is not None else ""}\n'
 
         e.description = txt
         await ctx.respond(embed = e)
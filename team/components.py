@@ -1,12 +1,16 @@
 from __future__ import annotations
 from typing import Optional, Union, TYPE_CHECKING
-from datetime import datetime
+from datetime import datetime, timedelta
 from discord.utils import format_dt
 import discord
+import re
 
 from team.errors import *
 from common.lang import Lang
 from common.utils import get_integers
+from common.api import CONFIG
+from common.scheduler import scheduler
+from common.member_index import member_index, ensure_chunked
 
 if TYPE_CHECKING:
     from discord import (
@@ -18,9 +22,63 @@ if TYPE_CHECKING:
         User
     )
     from discord.ui import Button, Item
+    from discord import Guild
     MessageLike = Union[Message, WebhookMessage]
     MemberLike = Union[Member, User]
 
+_MENTION = re.compile(r'<@!?([0-9]+)>')
+VOTE_REMINDERS: list[int] = CONFIG.get('vote_reminders', [60, 15])
+FIELD_LIMIT = 1024
+EMBED_LIMIT = 6000
+
+
+def to_members(guild: Guild, value: str) -> set[MemberLike]:
+    """members in a field value (mentions, or names in votes created before mentions were used)"""
+    ids = _MENTION.findall(value)
+
+    if ids:
+        return {guild.get_member(int(i)) for i in ids} - {None}
+
+    return {member_index.find(guild, i) for i in value[2:].split(', ')} - {None}
+
+
+def split_mentions(members: set[MemberLike], limit: int = FIELD_LIMIT) -> list[str]:
+    """field values listing every member, split so that none is longer than `limit`"""
+    values: list[str] = []
+    value = ''
+
+    for mention in [m.mention for m in members]:
+        if value and len(value) + 2 + len(mention) > limit:
+            values.append(value)
+            value = ''
+        value = f'{value}, {mention}' if value else f'> {mention}'
+
+    if value:
+        values.append(value)
+
+    return values
+
+
+def join_mentions(members: set[MemberLike], limit: int = FIELD_LIMIT) -> str:
+    """field value listing as many members as fit in `limit`, followed by `+N`"""
+    mentions = [m.mention for m in members]
+    value = '> ' + ', '.join(mentions)
+
+    if len(value) <= limit:
+        return value
+
+    value = '>'
+
+    for i, mention in enumerate(mentions):
+        rest = f', +{len(mentions) - i}' if i else f' +{len(mentions)}'
+
+        if len(value) + 2 + len(mention) + len(f', +{len(mentions) - i - 1}') > limit:
+            return value + rest
+
+        value += f', {mention}' if i else f' {mention}'
+
+    return value
+
 
 class VoteView(discord.ui.View):
 
@@ -75,12 +133,15 @@ class VoteView(discord.ui.View):
         interaction: Interaction
     ) -> None:
         await interaction.response.defer()
+        await ensure_chunked(interaction.guild)
         vote = VoteMessage.convert(interaction.message)
         vote.role_check(interaction.user)
         vote.can -= {interaction.user}
         vote.sub -= {interaction.user}
         vote.drop -= {interaction.user}
-        vote._data[select.values[0]] = ({interaction.user} | vote._data[select.values[0]]) & set(vote.role.members)
+        # only the clicking member is checked here; the whole role is read once, when the unanswered list is rendered
+        answer = select.values[0]
+        vote._data[answer] = {m for m in vote._data.get(answer, set()) if vote.role in getattr(m, 'roles', ())} | {interaction.user}
         await interaction.message.edit(embed=vote.embed, view=VoteView(vote.lang))
         await interaction.followup.send({'ja': '投票を更新しました'}.get(interaction.locale, 'Updated!'), ephemeral=True)
         return
@@ -89,6 +150,7 @@ class VoteView(discord.ui.View):
     @discord.ui.button(label='Mention', custom_id='mention', style=discord.ButtonStyle.primary)
     async def mention(self, button: Button, interaction: Interaction) -> None:
         await interaction.response.defer()
+        await ensure_chunked(interaction.guild)
         vote = VoteMessage.convert(interaction.message)
         vote.author_check(interaction.user)
         if vote.unanswered:
@@ -103,12 +165,14 @@ class VoteView(discord.ui.View):
     @discord.ui.button(label='Quit', custom_id='quit', style=discord.ButtonStyle.danger)
     async def quit(self, button: Button, interaction: Interaction) -> None:
         await interaction.response.defer()
+        await ensure_chunked(interaction.guild)
         vote = VoteMessage.convert(interaction.message)
         vote.author_check(interaction.user)
         await interaction.message.edit(
             content = {'ja':'投票を終了しました。'}.get(interaction.locale, 'Finished.'),
             view = None
         )
+        scheduler.cancel(message_id = interaction.message.id)
         return
 
 
@@ -121,7 +185,8 @@ class VoteMessage:
         '_message',
         '_dt',
         '_lang',
-        '_data'
+        '_data',
+        '_members'
     )
 
     def __init__(
@@ -141,6 +206,7 @@ class VoteMessage:
         self._dt: Optional[datetime] = dt
         self._lang: Lang = lang or Lang.JA
         self._data: dict[str, set[Member]] = data
+        self._members: Optional[set[MemberLike]] = None
 
 
     @property
@@ -199,9 +265,16 @@ class VoteMessage:
     def drop(self, value: set[MemberLike]) -> set[MemberLike]:
         self._data['drop'] = value
 
+    @property
+    def members(self) -> set[MemberLike]:
+        """every member of the role, read once per vote"""
+        if self._members is None:
+            self._members = set(self.role.members)
+        return self._members
+
     @property
     def unanswered(self) -> set[MemberLike]:
-        return (set(self.role.members)
+        return (self.members
                 - self.can
                 - self.sub
                 -self.drop)
@@ -213,34 +286,26 @@ class VoteMessage:
             color = discord.Colour.yellow(),
             description = self.role.mention
         )
-        e.set_footer(text=f'by {str(self.author)}')
+        e.set_footer(text=f'by {str(self.author)} ({self.author.id})')
         e.add_field(
             name = '日時' if self.lang == Lang.JA else 'Date',
             value = format_dt(self.dt, style='F'),
             inline = False
         )
-        if self.can:
-            e.add_field(
-                name = ('参加 ' if self.lang == Lang.JA else 'Participation ') + f'@{6-len(self.can)}',
-                value = '> ' + ', '.join([str(m) for m in self.can]),
-                inline = False
-            )
-        if self.sub:
-            e.add_field(
-                name = '補欠' if self.lang == Lang.JA else 'Substitute',
-                value = '> ' + ', '.join([str(m) for m in self.sub]),
-                inline = False
-            )
-        if self.drop:
-            e.add_field(
-                name = '不参加' if self.lang == Lang.JA else 'Not participation',
-                value = '> ' + ', '.join([str(m) for m in self.drop]),
-                inline = False
-            )
+        # answers are read back from the fields, so long lists continue in fields of the same name
+        for name, members in (
+            (('参加 ' if self.lang == Lang.JA else 'Participation ') + f'@{6-len(self.can)}', self.can),
+            ('補欠' if self.lang == Lang.JA else 'Substitute', self.sub),
+            ('不参加' if self.lang == Lang.JA else 'Not participation', self.drop)
+        ):
+            for value in split_mentions(members):
+                e.add_field(name = name, value = value, inline = False)
+
         if self.unanswered:
+            name = '未回答' if self.lang == Lang.JA else 'Un-answered'
             e.add_field(
-                name = '未回答' if self.lang == Lang.JA else 'Un-answered',
-                value = '> ' + ', '.join([str(m) for m in self.unanswered]),
+                name = name,
+                value = join_mentions(self.unanswered, min(FIELD_LIMIT, EMBED_LIMIT - len(e) - len(name))),
                 inline = False
             )
         return e
@@ -276,7 +341,12 @@ class VoteMessage:
 
         if role is None:
             raise RoleNotFound
-        author = message.guild.get_member_named(e.footer.text[3:])
+        author_ids = [i for i in get_integers(e.footer.text) if i > 10**15]
+
+        if author_ids:
+            author = message.guild.get_member(author_ids[-1])
+        else:
+            author = member_index.find(message.guild, e.footer.text[3:])
 
         if author is None:
             raise AuthorNotFound
@@ -288,11 +358,11 @@ class VoteMessage:
                 if  'Date' in field.name:
                     lang = Lang.EN
             elif field.name.startswith(('参加','Participation')):
-                data['can'] = {message.guild.get_member_named(i) for i in field.value[2:].split(', ')} - {None}
+                data['can'] = data.get('can', set()) | to_members(message.guild, field.value)
             elif field.name.startswith(('補欠', 'Substitute')):
-                data['sub'] = {message.guild.get_member_named(i) for i in field.value[2:].split(', ')} - {None}
+                data['sub'] = data.get('sub', set()) | to_members(message.guild, field.value)
             elif field.name.startswith(('不参加','Not participation')):
-                data['drop'] = {message.guild.get_member_named(i) for i in field.value[2:].split(', ')} - {None}
+                data['drop'] = data.get('drop', set()) | to_members(message.guild, field.value)
         return VoteMessage(
             enemy = enemy,
             role = role,
@@ -313,6 +383,9 @@ class VoteMessage:
         lang: str = 'ja'
         ) -> VoteMessage:
         lang = {'ja':Lang.JA}.get(lang, Lang.EN)
+        if not interaction.response.is_done():
+            await interaction.response.defer()
+        await ensure_chunked(role.guild)
         msg = VoteMessage(enemy = enemy, author = interaction.user, role = role, dt = dt, lang = lang)
         v = VoteView(lang = lang)
         if interaction.response.is_done():
@@ -320,6 +393,29 @@ class VoteMessage:
             msg._message = message
         else:
             res = await interaction.response.send_message(embed=msg.embed,view=v)
-            msg._message = res.message
+            msg._message = await res.original_response()
+        msg.schedule()
         return msg
 
+
+    def schedule(self) -> None:
+        """remind unanswered members `VOTE_REMINDERS` minutes before the match and close at the match time"""
+        if self.message is None or self.dt is None:
+            return
+
+        now = datetime.now(tz=self.dt.tzinfo)
+        payload = {
+            'guild_id': self.message.guild.id,
+            'channel_id': self.message.channel.id,
+            'message_id': self.message.id
+        }
+        jobs = [
+            (self.dt - timedelta(minutes=m), 'vote_remind', payload)
+            for m in VOTE_REMINDERS if self.dt - timedelta(minutes=m) > now
+        ]
+
+        if self.dt > now:
+            jobs.append((self.dt, 'vote_close', payload))
+
+        scheduler.add_many(jobs)
+
@@ -0,0 +1,55 @@
+import importlib.util
+import pathlib
+import types
+
+import pytest
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+
+def load_module(name: str, package: str = 'common') -> types.ModuleType:
+    """load a standalone module without running its package's `__init__`,
+    which connects to Google Cloud and the Sheets API on import"""
+    spec = importlib.util.spec_from_file_location(f'_{package}_{name}', ROOT / package / f'{name}.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    parser.addoption('--benchmark', action = 'store_true', help = 'also run wall-clock benchmarks')
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    config.addinivalue_line('markers', 'benchmark: wall-clock comparison, skipped unless --benchmark is given')
+
+
+def pytest_collection_modifyitems(config: pytest.Config, items: list[pytest.Item]) -> None:
+    if config.getoption('--benchmark'):
+        return
+
+    skip = pytest.mark.skip(reason = 'benchmark, run with --benchmark')
+
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope='session')
+def player() -> types.ModuleType:
+    return load_module('player')
+
+
+@pytest.fixture(scope='session')
+def utils() -> types.ModuleType:
+    return load_module('utils')
+
+
+@pytest.fixture(scope='session')
+def rank_table() -> types.ModuleType:
+    return load_module('rank_table')
+
+
+@pytest.fixture(scope='session')
+def handsup_lineup() -> types.ModuleType:
+    return load_module('lineup', 'handsup')
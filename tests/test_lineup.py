@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('discord')
+
+
+class Channel:
+    id = 1
+
+
+class Message:
+    """records every edit and holds each one until `release` is set"""
+
+    def __init__(self) -> None:
+        self.id = 10
+        self.channel = Channel()
+        self.edits: list[str] = []
+        self.editing = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def edit(self, content=None, embed=None) -> None:
+        self.editing.set()
+        await self.release.wait()
+        self.edits.append(embed)
+
+
+def test_schedule_during_edit_is_flushed(handsup_lineup):
+
+    async def main() -> None:
+        updater = handsup_lineup.LineupUpdater(delay = 0)
+        message = Message()
+        updater.schedule(message, 'first')
+        await message.editing.wait()
+        updater.schedule(message, 'second')
+        message.release.set()
+
+        for _ in range(10):
+            await asyncio.sleep(0)
+
+        assert message.edits == ['first', 'second']
+        assert not updater._tasks
+
+    asyncio.run(main())
+
+
+def test_cancel_then_schedule_keeps_new_task(handsup_lineup):
+
+    async def main() -> None:
+        updater = handsup_lineup.LineupUpdater(delay = 0)
+        message = Message()
+        message.release.set()
+        updater.schedule(message, 'first')
+        updater.cancel(message)
+        updater.schedule(message, 'second')
+
+        for _ in range(10):
+            await asyncio.sleep(0)
+
+        assert message.edits == ['second']
+        assert not updater._tasks
+
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+import random
+import timeit
+
+import pytest
+
+
+def make_data(n: int, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    data = []
+
+    for i in range(n):
+        d = {
+            'id': i,
+            'name': f'player{rng.randrange(n)}',
+            'registryId': rng.randrange(10**5),
+            'switchFc': f'{rng.randrange(10**4):04}-{rng.randrange(10**4):04}-{rng.randrange(10**4):04}'
+        }
+
+        if rng.random() < 0.8:
+            d['mmr'] = rng.randrange(0, 15000)
+
+        data.append(d)
+
+    return data
+
+
+def test_unique_players_keeps_first(player):
+    data = make_data(50)
+    players = player.unique_players(player.to_players(data))
+    seen = set()
+    expected = [d['id'] for d in data if not (d['name'] in seen or seen.add(d['name']))]
+    assert [p.id for p in players] == expected
+
+
+def test_sort_by_mmr_puts_placements_last(player):
+    players = player.to_players(make_data(50))
+    ret = player.sort_by_mmr(players)
+    rated = [p.mmr for p in ret if p.mmr is not None]
+    assert rated == sorted(rated, reverse = True)
+    assert [p.id for p in ret[len(rated):]] == [p.id for p in players if p.mmr is None]
+    assert sorted(p.id for p in ret) == sorted(p.id for p in players)
+
+
+def test_average_mmr(player):
+    assert player.average_mmr([]) is None
+    assert player.average_mmr(player.to_players([{'id': 1, 'name': 'a'}])) is None
+    assert player.average_mmr(player.to_players([
+        {'id': 1, 'name': 'a', 'mmr': 1000},
+        {'id': 2, 'name': 'b', 'mmr': 2000},
+        {'id': 3, 'name': 'c'}
+    ])) == 1500
+
+
+def test_to_players_keeps_missing(player):
+    players = player.to_players([None, {'id': 1, 'name': 'a', 'switchFc': '0000-0000-0000'}])
+    assert players[0] is None
+    assert players[1].switch_fc == '0000-0000-0000'
+    assert players[1].mmr is None
+
+
+def pandas_path(pd, data: list[dict]) -> tuple[list[int], float]:
+    """what the team commands did before `common.player`"""
+    df = pd.DataFrame(data).drop_duplicates(subset='name')
+    df = df[df['mmr'].notna()].sort_values('mmr', ascending=False)
+    return df['id'].tolist(), df['mmr'].mean()
+
+
+def list_path(player, data: list[dict]) -> tuple[list[int], float]:
+    players = player.unique_players(player.to_players(data))
+    rated = [p for p in player.sort_by_mmr(players) if p.mmr is not None]
+    return [p.id for p in rated], player.average_mmr(rated)
+
+
+@pytest.mark.parametrize('n', [12, 24, 100])
+def test_matches_pandas_path(player, n):
+    pd = pytest.importorskip('pandas')
+    data = make_data(n, seed = n)
+    ids, average = list_path(player, data)
+    expected_ids, expected_average = pandas_path(pd, data)
+    mmr = {d['id']: d['mmr'] for d in data if 'mmr' in d}
+    assert sorted(ids) == sorted(expected_ids)
+    assert [mmr[i] for i in ids] == [mmr[i] for i in expected_ids]
+    assert average == pytest.approx(expected_average)
+
+
+@pytest.mark.benchmark
+def test_benchmark_against_pandas_path(player):
+    pd = pytest.importorskip('pandas')
+    data = make_data(24)
+    number = 200
+    pandas_time = min(timeit.repeat(lambda: pandas_path(pd, data), number = number, repeat = 3)) / number
+    list_time = min(timeit.repeat(lambda: list_path(player, data), number = number, repeat = 3)) / number
+    assert list_time < pandas_time
@@ -0,0 +1,29 @@
+import pathlib
+
+import numpy as np
+import pytest
+
+ASSET_DIR = pathlib.Path(__file__).resolve().parent.parent / 'common' / 'assets' / 'ranks'
+
+
+def test_get_rank_table(rank_table):
+    table = rank_table.get_rank_table()
+    assert table.season == rank_table.LATEST_SEASON
+    assert rank_table.get_rank_table(table.season) is table
+
+    with pytest.raises(rank_table.UnknownSeason):
+        rank_table.get_rank_table(-1)
+
+
+def test_get_many_matches_get(rank_table):
+    table = rank_table.get_rank_table()
+    mmrs = np.concatenate([np.array(table.thresholds) + d for d in (-1, 0, 1)] + [np.arange(-500, 20000, 37)])
+    assert table.get_many(mmrs).tolist() == [table.get(m) for m in mmrs.tolist()]
+    assert table.get(-100) == table.names[0]
+    assert table.get(10**6) == table.names[-1]
+
+
+def test_rank_icons_are_bundled(rank_table):
+    for division in rank_table.RANK_DATA:
+        with open(ASSET_DIR / f'{division.lower()}.png', 'rb') as f:
+            assert f.read(8) == b'\x89PNG\r\n\x1a\n'
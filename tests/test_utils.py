@@ -0,0 +1,108 @@
+import random
+import re
+import string
+import timeit
+
+import pytest
+
+SEPARATORS = ['', '-', ' ', '.', '/']
+
+
+def legacy_maybe_param(txt: str) -> tuple:
+    """maybe_param before `classify`, with FCs limited to the separators `get_fcs` accepts"""
+    d_txt = re.sub(r'\D', '', txt)
+
+    if len(d_txt) >= 17 and len(d_txt) <= 19:
+        return None, int(d_txt), None
+
+    if re.fullmatch(r'[0-9]{4}[-. /]?[0-9]{4}[-. /]?[0-9]{4}', txt.strip()):
+        return None, None, f'{d_txt[:4]}-{d_txt[4:8]}-{d_txt[8:]}'
+
+    return txt, None, None
+
+
+def random_digits(rng: random.Random, n: int) -> str:
+    return ''.join(rng.choice(string.digits) for _ in range(n))
+
+
+def random_input(rng: random.Random) -> str:
+    kind = rng.randrange(5)
+
+    if kind == 0:
+        return rng.choice(SEPARATORS).join(random_digits(rng, 4) for _ in range(3))
+    if kind == 1:
+        return random_digits(rng, rng.randint(17, 19))
+    if kind == 2:
+        return f'<@{rng.choice(["", "!"])}{random_digits(rng, rng.randint(17, 19))}>'
+    if kind == 3:
+        return ''.join(rng.choice(string.ascii_letters + ' _') for _ in range(rng.randint(1, 16)))
+
+    return ''.join(rng.choice(string.printable) for _ in range(rng.randint(0, 30)))
+
+
+def test_classify_fc(utils):
+    rng = random.Random(0)
+
+    for _ in range(1000):
+        digits = random_digits(rng, 12)
+        txt = rng.choice(SEPARATORS).join([digits[:4], digits[4:8], digits[8:]])
+        assert utils.classify(txt) == (utils.KeyType.FC, f'{digits[:4]}-{digits[4:8]}-{digits[8:]}')
+
+
+def test_classify_discord_id(utils):
+    rng = random.Random(1)
+
+    for _ in range(1000):
+        digits = random_digits(rng, rng.randint(17, 19))
+        assert utils.classify(digits) == (utils.KeyType.DISCORD_ID, int(digits))
+        assert utils.classify(f'<@{digits}>') == (utils.KeyType.MENTION, int(digits))
+        assert utils.classify(f' <@!{digits}> ') == (utils.KeyType.MENTION, int(digits))
+
+
+def test_classify_rejects_20_digit_id(utils):
+    digits = '1' * 20
+    assert utils.classify(digits) == (utils.KeyType.NAME, digits)
+    assert utils.classify(f'<@{digits}>') == (utils.KeyType.NAME, f'<@{digits}>')
+
+
+def test_classify_name(utils):
+    rng = random.Random(2)
+
+    for _ in range(1000):
+        txt = ''.join(rng.choice(string.ascii_letters + ' _-') for _ in range(rng.randint(1, 16)))
+        assert utils.classify(txt) == (utils.KeyType.NAME, txt)
+
+
+def test_maybe_param_matches_legacy(utils):
+    rng = random.Random(3)
+
+    for _ in range(5000):
+        txt = random_input(rng)
+
+        if utils.classify(txt).type == utils.KeyType.MENTION:
+            assert utils.maybe_param(txt) == (None, utils.classify(txt).value, None)
+        else:
+            assert utils.maybe_param(txt) == legacy_maybe_param(txt)
+
+
+def test_get_fcs(utils):
+    rng = random.Random(4)
+
+    for _ in range(1000):
+        fcs = ['-'.join(random_digits(rng, 4) for _ in range(3)) for _ in range(rng.randint(0, 12))]
+        noise = [''.join(rng.choice(string.ascii_letters + ' \n') for _ in range(rng.randint(1, 5))) for _ in fcs]
+        txt = ''.join(n + rng.choice(SEPARATORS).join(fc.split('-')) for n, fc in zip(noise, fcs))
+        assert utils.get_fcs(txt) == fcs
+        assert [utils.get_fc(fc) for fc in fcs] == fcs
+
+    assert utils.get_fcs('10000-0000-0000 0000-0000-00000') == []
+
+
+@pytest.mark.benchmark
+def test_benchmark_classify(utils):
+    rng = random.Random(5)
+    inputs = [random_input(rng) for _ in range(1000)]
+    number = 20
+    legacy_time = min(timeit.repeat(lambda: [legacy_maybe_param(t) for t in inputs], number = number, repeat = 3)) / number / len(inputs)
+    classify_time = min(timeit.repeat(lambda: [utils.classify(t) for t in inputs], number = number, repeat = 3)) / number / len(inputs)
+    assert classify_time < 50e-6
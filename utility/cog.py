@@ -4,15 +4,34 @@ from discord import (
     SlashCommand,
     slash_command,
     Option,
+    OptionChoice,
     Embed,
     Colour,
-    Message
+    Message,
+    Member,
+    User,
+    Guild
 )
 from discord.ext import commands, pages
 import asyncio
-import re
 
-from common import get_lounger, LoungeEmbed, mkmg, maybe_param, get_player
+from common import (
+    get_lounger,
+    LoungeEmbed,
+    mkmg,
+    maybe_param,
+    get_fcs,
+    member_index,
+    ensure_chunked,
+    forget_chunked,
+    metrics,
+    get_player,
+    player_resolver,
+    Player,
+    to_players,
+    sort_by_mmr,
+    average_mmr
+)
 from .errors import *
 
 MKC_URL = 'https://www.mariokartcentral.com/mkc/registry/players/'
@@ -25,25 +44,36 @@ class Utility(commands.Cog, name='Utility'):
         self.hide: bool = False
         self.description: str = 'Utilities'
         self.description_localizations: dict[str, str] = {'ja':'ユーティリティ'}
+        self._help_key: tuple[int, ...] = ()
+        self._help_pages: dict[str, dict[str, Embed]] = {}
 
 
-    @slash_command(
-        name = 'help',
-        description = 'Show command help',
-        description_localizations = {'ja':'コマンドの使い方'}
-    )
-    async def help(self, ctx: ApplicationContext) -> None:
-        await ctx.response.defer()
-        embeds: list[Embed] = []
-        is_ja: bool = ctx.locale == 'ja'
+    def help_pages(self, locale: str) -> dict[str, Embed]:
+        """help page of every visible cog, built once per locale
 
-        for _, cog in self.bot.cogs.items():
+        The pages are rebuilt only when the loaded cogs change (e.g. reload).
+        """
+        key = tuple(id(cog) for cog in self.bot.cogs.values())
+
+        if key != self._help_key:
+            self._help_key = key
+            self._help_pages = {}
+
+        cached = self._help_pages.get(locale)
+
+        if cached is not None:
+            return cached
+
+        embeds: dict[str, Embed] = {}
+        is_ja: bool = locale == 'ja'
+
+        for name, cog in self.bot.cogs.items():
 
             if cog.hide:
                 continue
 
             e = Embed(
-                title = cog.description_localizations.get(ctx.locale, cog.description),
+                title = cog.description_localizations.get(locale, cog.description),
                 color = Colour.yellow()
             )
             e.set_footer(text = '<必須> [任意]' if is_ja else '<Required> [Optional]')
@@ -53,7 +83,7 @@ class Utility(commands.Cog, name='Utility'):
                 if isinstance(command, SlashCommand):
                     usage = command.description_localizations
                     if usage is not None:
-                        usage = usage.get(ctx.locale, command.description)
+                        usage = usage.get(locale, command.description)
                     e.add_field(
                         name = f'/{command.qualified_name}',
                         value = '> '+ usage or command.description,
@@ -71,9 +101,45 @@ class Utility(commands.Cog, name='Utility'):
                     )
 
 
-            embeds.append(e)
+            embeds[name] = e
+
+        self._help_pages[locale] = embeds
+        return embeds
 
-        await pages.Paginator(pages=embeds, author_check=False).respond(ctx.interaction)
+
+    @slash_command(
+        name = 'help',
+        description = 'Show command help',
+        description_localizations = {'ja':'コマンドの使い方'}
+    )
+    async def help(
+        self,
+        ctx: ApplicationContext,
+        category: Option(
+            str,
+            name = 'category',
+            name_localizations = {'ja': 'カテゴリー'},
+            description = 'Show only this category',
+            description_localizations = {'ja': '表示するカテゴリー'},
+            choices = [
+                OptionChoice(name = 'Recruitment of Participants', value = 'Match', name_localizations = {'ja': '挙手関連'}),
+                OptionChoice(name = 'About Sokuji', value = 'Mogi', name_localizations = {'ja': '即時関連'}),
+                OptionChoice(name = 'Manage Results', value = 'Result', name_localizations = {'ja': '戦績管理'}),
+                OptionChoice(name = 'Manage team info', value = 'Team', name_localizations = {'ja': 'チーム関連'}),
+                OptionChoice(name = 'Utilities', value = 'Utility', name_localizations = {'ja': 'ユーティリティ'})
+            ],
+            required = False,
+            default = None
+        )
+    ) -> None:
+        embeds = self.help_pages(ctx.locale)
+
+        if category in embeds:
+            await ctx.respond(embed = embeds[category])
+            return
+
+        await ctx.response.defer()
+        await pages.Paginator(pages=list(embeds.values()), author_check=False).respond(ctx.interaction)
         return
 
     @slash_command(
@@ -95,7 +161,8 @@ class Utility(commands.Cog, name='Utility'):
         await ctx.response.defer()
         name, discord_id, fc = maybe_param(input_str)
 
-        member = ctx.guild.get_member_named(input_str)
+        await ensure_chunked(ctx.guild)
+        member = member_index.find(ctx.guild, input_str)
 
         try:
             discord_id = discord_id or member.id
@@ -144,59 +211,38 @@ class Utility(commands.Cog, name='Utility'):
 
     @staticmethod
     async def from_fc(text: str, sort_values: Optional[bool] = None) -> Embed:
-        _RE = re.compile(r'[0-9]{4}\-[0-9]{4}\-[0-9]{4}')
-        inputs: list[str] = _RE.findall(text)
-        dummy = inputs.copy()
-        tasks = [asyncio.create_task(get_lounger(fc = fc)) for fc in inputs]
-        players: list[Optional[dict]] = await asyncio.gather(*tasks, return_exceptions = False)
-        count: int = 0
-        display_count: int = 0
-        total_mmr: int = 0
+        inputs: list[str] = get_fcs(text)
+        players: list[Optional[Player]] = to_players(await player_resolver.resolve('fc', inputs))
+        found: list[Player] = [p for p in players if p is not None]
         content: str = ''
 
-        if sort_values is not None:
-            lineup: list[dict] = sorted(
-                [p for p in players if p is not None and p.get('mmr') is not None],
-                reverse = bool(sort_values),
-                key = lambda p: p['mmr']
-            )
-        else:
-            lineup: list[dict] = [p for p in players]
-
-        for i, player in enumerate(lineup):
-
-            if player is not None:
-                display_count += 1
+        if not found:
+            raise PlayerNotFound
 
-                if player.get('mmr') is None:
-                    content += f'{str(display_count).rjust(3)}: [{player["name"]}]({MKC_URL}{player["registryId"]})\n'
-                else:
-                    count += 1
-                    content += f'{str(display_count).rjust(3)}: [{player["name"]}]({MKC_URL}{player["registryId"]}) (MMR: {player["mmr"]})\n'
-                    total_mmr += player["mmr"]
+        if sort_values is None:
+            lineup = list(zip(inputs, players))
+        else:
+            lineup = [(p.switch_fc, p) for p in sort_by_mmr(found, reverse = bool(sort_values))]
+            lineup += [(fc, p) for fc, p in zip(inputs, players) if p is None]
 
-                dummy.remove(player['switchFc'])
-            else:
-                content +=f"N/A ({inputs[i]})\n"
-                dummy.remove(inputs[i])
+        display_count: int = 0
 
-        if display_count == 0:
-            raise PlayerNotFound
+        for fc, player in lineup:
 
+            if player is None:
+                content += f"N/A ({fc})\n"
+                continue
 
-        if sort_values is not None:
-            for placement in [p for p in players if p is not None and p.get('mmr') is None]:
-                display_count += 1
-                content += f'{str(display_count).rjust(3)}: [{placement["name"]}]({MKC_URL}{placement["registryId"]})\n'
-                dummy.remove(placement['switchFc'])
+            display_count += 1
+            content += f'{str(display_count).rjust(3)}: [{player.name}]({MKC_URL}{player.registry_id})'
+            content += f' (MMR: {player.mmr})\n' if player.mmr is not None else '\n'
 
-        for fc in dummy:
-            content +=f"N/A ({fc})\n"
+        average = average_mmr(found)
 
-        if count >=1:
-            e = LoungeEmbed(
-                mmr = total_mmr/count,
-                title = f'Average MMR: {total_mmr/count:.1f}',
+        if average is not None:
+            e = LoungeEmbed.create(
+                mmr = average,
+                title = f'Average MMR: {average:.1f}',
             )
             e.description = content + f'\n**Rank** {e.rank}'
         else:
@@ -206,7 +252,38 @@ class Utility(commands.Cog, name='Utility'):
 
 
 
+    @commands.Cog.listener()
+    async def on_member_join(self, member: Member) -> None:
+        member_index.add(member)
+
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: Member) -> None:
+        member_index.remove(member)
+
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: Member, after: Member) -> None:
+        member_index.update(after)
+
+
+    @commands.Cog.listener()
+    async def on_user_update(self, before: User, after: User) -> None:
+        for guild in after.mutual_guilds:
+            member = guild.get_member(after.id)
+
+            if member is not None:
+                member_index.update(member)
+
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: Guild) -> None:
+        member_index.forget(guild.id)
+        forget_chunked(guild.id)
+
+
     @commands.Cog.listener('on_message')
+    @metrics.timed('listener fm_message')
     async def fm_message(self, message: Message) -> None:
         payload: dict = {}
 
@@ -226,5 +303,11 @@ class Utility(commands.Cog, name='Utility'):
             payload['content'] = 'プレイヤーが見つかりません。\nPlayer not found.'
             payload['delete_after'] = 10.0
 
+        if isinstance(payload.get('embed'), LoungeEmbed):
+            file = payload['embed'].file
+
+            if file is not None:
+                payload['file'] = file
+
         if payload:
             await message.channel.send(**payload)